@@ -0,0 +1,220 @@
+"""
+Benchmarks of the hot paths on synthetic data of growing size.
+
+    python benchmarks/hot_paths.py --sizes 10x100,50x500,200x1000 --thresholds benchmarks/thresholds.json
+
+Every size is "streamers x entries per streamer", the data comes from benchmarks/synthetic.py and is the same
+on every run. Prints JSON with the median time of every benchmark at every size, and the scaling exponent
+of each benchmark, the slope of log(time) over log(total entries).
+
+Exits with status 1 when a benchmark at the largest size is slower than its threshold in seconds,
+or than --tolerance times its time in a --baseline result file.
+The table benchmark needs a display and is skipped without one.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from benchmarks.synthetic import generate  # noqa: E402
+from twitch_points_list import TwitchPointsList, plot_cache  # noqa: E402
+from twitch_points_models import WINDOW_DAYS, TwitchPointsModels  # noqa: E402
+from twitch_points_series import PointsSeries  # noqa: E402
+from twitch_points_storage import Storage  # noqa: E402
+
+
+def measure(run, setup=None, repeat=5):
+    """
+    :param run: function to time
+    :param setup: function called before every run, not timed
+    :param repeat: number of runs
+    :return: median time in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def fitted_models(twitch_points):
+    models = TwitchPointsModels()
+    models.construct_models(twitch_points.streamers)
+    return models
+
+
+def bench_files(twitch_points, directory, repeat):
+    filename = os.path.join(directory, "twitch_points.csv")
+    store = os.path.join(directory, "twitch_points.bin")
+    results = {"save_to_file": measure(lambda: twitch_points.save_to_file(filename), repeat=repeat),
+               "load_from_file": measure(lambda: TwitchPointsList().load_from_file(filename), repeat=repeat)}
+    TwitchPointsList().load_from_file(filename, store)
+    results["load_from_store"] = measure(lambda: TwitchPointsList().load_from_file(filename, store), repeat=repeat)
+    results["load_tail"] = measure(lambda: TwitchPointsList().load_tail(filename, store), repeat=repeat)
+    return results
+
+
+def bench_models(twitch_points, repeat):
+    streamers = twitch_points.streamers
+    models = TwitchPointsModels()
+    results = {"construct_model": measure(lambda: [models.construct_model(streamer) for streamer in streamers],
+                                          setup=models.models.clear, repeat=repeat),
+               "construct_models": measure(lambda: models.construct_models(streamers), repeat=repeat),
+               "when_target": measure(lambda: [models.when_target(streamer) for streamer in streamers
+                                               if streamer.target is not None], repeat=repeat),
+               "when_targets": measure(lambda: models.when_targets(streamers), repeat=repeat)}
+    for streamer, est_date in zip(streamers, models.when_targets(streamers)):
+        streamer.est_date = est_date
+    return results
+
+
+def bench_series(twitch_points, repeat):
+    # concatenate_dates and concatenate_data were replaced by the daily index of PointsSeries,
+    # building it and reading the fitting windows from it are the equivalent paths
+    streamers = twitch_points.streamers
+    storage = Storage()
+    return {"build_series": measure(lambda: [PointsSeries.from_arrays(streamer.timestamps, streamer.points)
+                                             for streamer in streamers], repeat=repeat),
+            "daily_window": measure(lambda: [storage.daily_window(streamer, WINDOW_DAYS) for streamer in streamers],
+                                    repeat=repeat),
+            "to_df": measure(twitch_points.to_df, repeat=repeat)}
+
+
+def bench_plot(twitch_points, repeat):
+    streamer = max(twitch_points.streamers, key=len)
+    model = fitted_models(twitch_points).models[streamer]
+    return {"get_plot": measure(lambda: streamer.get_plot(model, 420, background_color="#383838"),
+                                setup=plot_cache.clear, repeat=repeat),
+            "get_plot_cached": measure(lambda: streamer.get_plot(model, 420, background_color="#383838"),
+                                       repeat=repeat)}
+
+
+def bench_table(twitch_points, repeat):
+    import tkinter as tk
+
+    from gui.twitch_points_table import TwitchPointsTable
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Skipping the table benchmark: {e}", file=sys.stderr)
+        return {}
+    root.withdraw()
+    try:
+        table = TwitchPointsTable(root, twitch_points)
+        streamer = twitch_points.streamers[0]
+        columns = iter(["points", "name", "target", "est_date", "percentage"] * repeat)
+
+        def sort():
+            table.current_sort_column = next(columns)
+            table.refresh_table()
+
+        def edit():
+            streamer.target = (streamer.target or 0) + 1
+            table.refresh_streamer(streamer)
+            table.refresh_table()
+
+        return {"refresh_table_sort": measure(sort, repeat=repeat),
+                "refresh_table_edit": measure(edit, repeat=repeat)}
+    finally:
+        root.destroy()
+
+
+def run_size(streamers, entries, repeat, table):
+    twitch_points = generate(streamers, entries)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results.update(bench_files(twitch_points, directory, repeat))
+    results.update(bench_models(twitch_points, repeat))
+    results.update(bench_series(twitch_points, repeat))
+    results.update(bench_plot(twitch_points, repeat))
+    if table:
+        results.update(bench_table(twitch_points, repeat))
+    return results
+
+
+def scaling(curve):
+    """
+    Slope of log(time) over log(total entries), 1 is linear. None with less than two sizes.
+    """
+    if len(curve) < 2:
+        return None
+    sizes = np.log([point["streamers"] * point["entries"] for point in curve])
+    times = np.log([max(point["seconds"], 1e-9) for point in curve])
+    return round(float(np.polyfit(sizes, times, 1)[0]), 2)
+
+
+def check(results, thresholds, baseline, tolerance):
+    """
+    :return: failure messages
+    """
+    failures = []
+    for name, curve in results["benchmarks"].items():
+        seconds = curve[-1]["seconds"]
+        if name in thresholds and seconds > thresholds[name]:
+            failures.append(f"{name} took {seconds:.4f}s, threshold {thresholds[name]}s")
+        if baseline and name in baseline["benchmarks"]:
+            previous = baseline["benchmarks"][name][-1]["seconds"]
+            if seconds > previous * tolerance:
+                failures.append(f"{name} took {seconds:.4f}s, {seconds / previous:.2f}x the baseline")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10x100,50x500,200x1000",
+                        help="comma separated streamers x entries sizes, the last one is checked")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-table", action="store_true", help="skip the Tk table benchmark")
+    parser.add_argument("--thresholds", help="json file of benchmark name -> maximum seconds at the largest size")
+    parser.add_argument("--baseline", help="json output of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown against the baseline")
+    parser.add_argument("--output", help="write the results to this file as well")
+    args = parser.parse_args()
+
+    # The table loads its icons relative to the repository
+    os.chdir(ROOT)
+    sizes = [tuple(int(value) for value in size.split("x")) for size in args.sizes.split(",")]
+    benchmarks = {}
+    for streamers, entries in sizes:
+        for name, seconds in run_size(streamers, entries, args.repeat, not args.no_table).items():
+            benchmarks.setdefault(name, []).append({"streamers": streamers, "entries": entries, "seconds": seconds})
+    results = {"benchmarks": benchmarks,
+               "scaling": {name: scaling(curve) for name, curve in benchmarks.items()}}
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+
+    thresholds = {}
+    if args.thresholds:
+        with open(args.thresholds) as file:
+            thresholds = json.load(file)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    skipped = [name for name in thresholds if name not in benchmarks]
+    if skipped:
+        print(f"Not checked, did not run: {', '.join(skipped)}", file=sys.stderr)
+    failures = check(results, thresholds, baseline, args.tolerance)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
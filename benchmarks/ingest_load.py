@@ -0,0 +1,176 @@
+"""
+Load generator for the ingestion server: measures the sustained rate at which readings are accepted and applied.
+
+    python benchmarks/ingest_load.py --serve --clients 8 --batch 200 --channels 500 --duration 10
+    python benchmarks/ingest_load.py --port 8765
+
+With --serve a headless twitch_points_server.py is started on a free port in a temporary directory, otherwise
+the readings go to a running server, e.g. main.py --serve PORT. Each client posts batches of readings of random
+channels on one keep-alive connection, as fast as the server answers. Once the duration is over the server's
+/status is polled until every reading was applied.
+
+Prints JSON with the request latency percentiles, the accepted rate, and the applied rate over the whole run
+including the time to drain the backlog, which is the sustained throughput.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Connection:
+    """
+    Keep-alive HTTP/1.1 connection to the server.
+    """
+
+    def __init__(self, host, port, unix_path=None):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        if self.unix_path:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.unix_path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, payload=None):
+        """
+        :return: (status, json payload)
+        """
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            key, _, value = line.decode("latin-1").partition(":")
+            if key.lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        self.writer.close()
+
+
+def readings(rng, channels, batch):
+    """
+    :return: batch of readings of random channels, without dates like a scraper reporting what it just saw
+    """
+    return [{"name": f"channel_{rng.randrange(channels):05d}", "points": rng.randrange(1_000_000)}
+            for _ in range(batch)]
+
+
+async def client(args, seed, deadline, latencies):
+    rng = random.Random(seed)
+    connection = Connection(args.host, args.port, args.unix)
+    await connection.open()
+    sent = 0
+    try:
+        while time.perf_counter() < deadline:
+            payload = readings(rng, args.channels, args.batch)
+            start = time.perf_counter()
+            status, body = await connection.request("POST", "/readings", payload)
+            latencies.append(time.perf_counter() - start)
+            if status != 202:
+                raise RuntimeError(f"Server answered {status}: {body}")
+            sent += body["accepted"]
+    finally:
+        connection.close()
+    return sent
+
+
+async def run(args):
+    connection = Connection(args.host, args.port, args.unix)
+    await connection.open()
+    _, status = await connection.request("GET", "/status")
+    applied_before = status["applied"]
+
+    latencies = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    sent = sum(await asyncio.gather(*(client(args, seed, deadline, latencies) for seed in range(args.clients))))
+    posted = time.perf_counter()
+
+    # Wait for the backlog to be applied
+    while True:
+        _, status = await connection.request("GET", "/status")
+        if status["applied"] - applied_before >= sent or time.perf_counter() - posted > args.drain_timeout:
+            break
+        await asyncio.sleep(0.05)
+    applied = time.perf_counter()
+    connection.close()
+
+    latencies.sort()
+    return {"clients": args.clients,
+            "batch": args.batch,
+            "channels": args.channels,
+            "requests": len(latencies),
+            "readings": sent,
+            "applied": status["applied"] - applied_before,
+            "accepted_per_second": sent / (posted - start),
+            "applied_per_second": (status["applied"] - applied_before) / (applied - start),
+            "drain_seconds": applied - posted,
+            "latency": {"p50": statistics.median(latencies),
+                        "p90": latencies[int(len(latencies) * 0.9)],
+                        "p99": latencies[int(len(latencies) * 0.99)],
+                        "max": latencies[-1]}}
+
+
+def start_server(directory):
+    """
+    Start a headless server on a free port with empty data in directory.
+    :return: (process, port)
+    """
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "twitch_points_server.py"), "--port", "0"],
+                               cwd=directory, stderr=subprocess.PIPE, text=True)
+    line = process.stderr.readline()
+    match = re.search(r":(\d+)$", line.strip())
+    if match is None:
+        process.kill()
+        raise RuntimeError(f"Server did not start: {line}{process.stderr.read()}")
+    return process, int(match.group(1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="connect to a Unix socket instead")
+    parser.add_argument("--serve", action="store_true", help="start a headless server with empty data to measure")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent connections")
+    parser.add_argument("--batch", type=int, default=100, help="readings per request")
+    parser.add_argument("--channels", type=int, default=500, help="number of distinct streamers")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to post for")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="seconds to wait for the backlog")
+    args = parser.parse_args()
+
+    if not args.serve:
+        print(json.dumps(asyncio.run(run(args)), indent=2))
+        return 0
+    with tempfile.TemporaryDirectory() as directory:
+        process, args.port = start_server(directory)
+        args.unix = None
+        try:
+            results = asyncio.run(run(args))
+        finally:
+            process.terminate()
+            process.communicate(timeout=60)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Startup benchmark: import time of main.py and time to the first paint of the GUI.
+
+Every measurement runs in a fresh interpreter, so module caches do not hide slow imports.
+Run from anywhere:
+
+    python benchmarks/startup.py --data twitch_points.csv --runs 5 --max-first-paint 1.0
+
+Prints JSON results, and exits with status 1 when a median exceeds its --max-* threshold.
+The first paint measurement needs a display.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child_import():
+    start = time.perf_counter()
+    import main  # noqa: F401
+    return {"import": time.perf_counter() - start}
+
+
+def child_first_paint(data, models_file):
+    start = time.perf_counter()
+    from gui.twitch_points_gui import TwitchPointsGUI
+    from twitch_points_profiles import DEFAULT_PROFILE, Profile, ProfileManager
+    from twitch_points_storage import CsvStorage
+    imported = time.perf_counter()
+
+    profiles = ProfileManager([Profile(DEFAULT_PROFILE, CsvStorage(data), models_file)])
+    profiles.load(DEFAULT_PROFILE, fit=False).result()
+    loaded = time.perf_counter()
+
+    gui = TwitchPointsGUI(profiles, start=False)
+    gui.window.update()
+    first_paint = time.perf_counter()
+
+    # Models and the plot are filled in by idle callbacks
+    while gui.plot is None:
+        gui.window.update()
+    gui.window.update()
+    plotted = time.perf_counter()
+    # Writes the fitted models, so the next run restores them
+    gui.on_close()
+
+    return {"import": imported - start,
+            "load": loaded - start,
+            "first_paint": first_paint - start,
+            "plot": plotted - start}
+
+
+def import_profile():
+    """
+    Cumulative import time of the slowest modules imported by main.py and its modules, from python -X importtime.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level <= 2:
+            modules[name.strip()] = int(cumulative) / 1e6
+    return dict(sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10])
+
+
+def run_child(*args):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", *args],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def medians(runs):
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="twitch_points.csv", help="csv file loaded at startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-gui", action="store_true", help="only measure the import time")
+    parser.add_argument("--max-import", type=float, help="maximum median import time in seconds")
+    parser.add_argument("--max-first-paint", type=float, help="maximum median time to first paint in seconds")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, ROOT)
+        if args.child[0] == "import":
+            print(json.dumps(child_import()))
+        else:
+            print(json.dumps(child_first_paint(*args.child[1:])))
+        return 0
+
+    results = {"import": medians([run_child("import") for _ in range(args.runs)]),
+               "import_profile": import_profile()}
+    if not args.no_gui:
+        with tempfile.TemporaryDirectory() as directory:
+            data = os.path.abspath(args.data)
+            models_file = os.path.join(directory, "models.dat")
+            # The first run fits and stores the models, the measured ones restore them like a normal startup
+            runs = [run_child("first_paint", data, models_file) for _ in range(args.runs + 1)]
+            results["startup"] = medians(runs[1:])
+    print(json.dumps(results, indent=2))
+
+    failed = False
+    if args.max_import is not None and results["import"]["import"] > args.max_import:
+        print(f"import took {results['import']['import']:.3f}s, more than {args.max_import}s", file=sys.stderr)
+        failed = True
+    if args.max_first_paint is not None and "startup" in results \
+            and results["startup"]["first_paint"] > args.max_first_paint:
+        print(f"first paint took {results['startup']['first_paint']:.3f}s, more than {args.max_first_paint}s",
+              file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
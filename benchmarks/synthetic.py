@@ -0,0 +1,57 @@
+"""
+Deterministic synthetic streamer histories for the benchmarks.
+
+Each streamer is watched on most days with a few days long gaps in between. On a watched day the points
+are entered in a burst of a few readings a couple of minutes apart. Points grow by a per-streamer daily rate,
+with occasional spending that drops them.
+"""
+import numpy as np
+
+from twitch_points_list import Streamer, TwitchPointsList
+from twitch_points_series import US_PER_DAY, US_PER_SECOND, to_timestamp
+
+START = to_timestamp(np.datetime64("2023-01-01T18:00:00"))
+
+
+def streamer_history(rng, entries):
+    """
+    :param rng: numpy Generator
+    :param entries: number of entries
+    :return: (timestamps, points) int64 arrays, in time order
+    """
+    # Watched days, most follow each other, some after a gap of up to two weeks
+    bursts = rng.integers(1, 6, size=entries)
+    days = np.repeat(np.arange(len(bursts)), bursts)[:entries]
+    gaps = np.where(rng.random(len(bursts)) < 0.1, rng.integers(2, 15, size=len(bursts)), 1)
+    day_offsets = np.cumsum(gaps)[days]
+
+    # Within a day, the readings of a burst are minutes apart, starting at a random hour in the evening
+    first_of_day = np.concatenate(([True], days[1:] != days[:-1]))
+    intervals = np.where(first_of_day, 0, rng.integers(60, 600, size=entries))
+    elapsed = np.cumsum(intervals)
+    within = elapsed - np.maximum.accumulate(np.where(first_of_day, elapsed, 0))
+    start_hour = rng.integers(0, 6, size=len(bursts))[days]
+    timestamps = START + day_offsets * US_PER_DAY + (start_hour * 3600 + within) * US_PER_SECOND
+
+    rate = rng.integers(500, 5000)
+    steps = np.where(first_of_day, rate * gaps[days], rng.integers(0, 300, size=entries))
+    spending = np.where(rng.random(entries) < 0.02, -rng.integers(0, 20000, size=entries), 0)
+    points = np.maximum(rng.integers(0, 100000) + np.cumsum(steps + spending), 0)
+    return timestamps.astype(np.int64), points.astype(np.int64)
+
+
+def generate(streamers, entries, seed=0):
+    """
+    Generate a list of streamers.
+    :param streamers: number of streamers
+    :param entries: number of entries per streamer
+    :param seed: random seed, the same seed gives the same list
+    :return: TwitchPointsList
+    """
+    rng = np.random.default_rng(seed)
+    twitch_points = TwitchPointsList()
+    for i in range(streamers):
+        timestamps, points = streamer_history(rng, entries)
+        target = None if rng.random() < 0.1 else int(points[-1] * rng.uniform(1.1, 5))
+        twitch_points.add_entry(Streamer.from_arrays(f"streamer_{i:05d}", timestamps, points, target))
+    return twitch_points
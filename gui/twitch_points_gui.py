@@ -1,12 +1,18 @@
 import tkinter as tk
 from datetime import datetime
+from tkinter import filedialog
 from tkinter import messagebox
 from tkinter import ttk
-from PIL import Image, ImageTk
 
+from gui.twitch_points_plot_loader import PlotLoader
 from gui.twitch_points_table import TwitchPointsTable
 from twitch_points_list import Streamer
-from twitch_points_models import TwitchPointsModels
+from twitch_points_trace import defer_interaction, interaction, span
+
+# How often the profile selection checks for profiles that finished loading
+PROFILE_POLL_MS = 200
+# How often readings received by the ingestion server are applied
+INGEST_POLL_MS = 100
 
 
 def format_number(num, precision=2):
@@ -22,17 +28,32 @@ def format_number(num, precision=2):
 
 
 class TwitchPointsGUI:
-    def __init__(self, twitch_points_list, models):
+    def __init__(self, profiles, start=True, server=None):
+        """
+        The window and the table are shown first, models and the plot are loaded once the window is up.
+        :param profiles: ProfileManager, the window opens on its default profile, which has to be loaded.
+                         Its models are restored or fitted after the first paint.
+                         Other profiles can be switched to once they finished loading in the background.
+        :param start: whether to run the Tk main loop
+        :param server: running IngestServer, whose readings are applied on the Tk thread as they arrive
+        """
         self.window = tk.Tk()
         self.window.title("Twitch Points")
         self.window.iconbitmap("gui/twtracker.ico")
         self.window.geometry("1200x600")
 
-        self.twitch_points_list = twitch_points_list
-        self.twitch_points_models = models
+        self.profiles = profiles
+        self.server = server
+        self.profile = None
+        self.twitch_points_list = None
+        self.twitch_points_models = None
+        self.storage = None
+        # Edits are saved in the background, pending ones are written when the window is closed
+        self.persistence = None
+        self.use_profile(profiles.profiles[profiles.default])
 
-        self.current_file = "twitch_points.csv"
         self.current_column = "percentage"
+        self.window.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Dark theme
         self.window.configure(bg="#383838")
@@ -42,20 +63,12 @@ class TwitchPointsGUI:
         style.map('.', background=[('selected', 'black')], foreground=[('selected', 'white')])
         style.map('Treeview', background=[('selected', '#4A6984')], foreground=[('selected', 'white')])
 
-        top_streamer = None
-        if len(self.twitch_points_list.streamers) > 0:
-            top_streamer = self.twitch_points_list.streamers[0]
-            for streamer in self.twitch_points_list.streamers:
-                if streamer.points[-1] > top_streamer.points[-1]:
-                    top_streamer = streamer
-
-        self.plotted_streamer = top_streamer
+        self.plotted_streamer = self.top_streamer()
 
         self.table = TwitchPointsTable(self.window, self.twitch_points_list)
-        self.plot_img_tk = None
-        if self.plotted_streamer:
-            self.plot_frame, plot_img_tk = self.create_streamer_plot(self.plotted_streamer)
-            self.plot_frame.grid(row=0, column=1, sticky="nsew")
+        self.plot = None
+        # Queries and downsamples the entries to plot off the Tk thread
+        self.plot_loader = PlotLoader(self.window)
 
         # Grid
         self.window.grid_columnconfigure(0, minsize=452)
@@ -63,7 +76,7 @@ class TwitchPointsGUI:
         self.window.grid_rowconfigure(0, minsize=420)
         self.window.grid_rowconfigure(1, minsize=100)
 
-        self.table.treeview.grid(row=0, column=0, columnspan=1)
+        self.table.frame.grid(row=0, column=0, columnspan=1)
 
         bottom_left_frame = tk.Frame(self.window, bg="#383838")
         bottom_left_frame.grid(row=1, column=0, sticky="nsew")
@@ -71,28 +84,137 @@ class TwitchPointsGUI:
         self.name_entry = None
         self.points_entry = None
         self.target_entry = None
+        self.profile_box = None
+        # Profiles whose loading failed and was reported
+        self.failed_profiles = set()
         self.create_control_buttons(bottom_left_frame)
 
         self.table.treeview.bind("<Button-1>", self.on_click)
         self.table.treeview.bind("<Double-1>", self.on_double_click)
+        self.table.treeview.bind("<KeyRelease-Up>", self.on_key_select)
+        self.table.treeview.bind("<KeyRelease-Down>", self.on_key_select)
+
+        # Fill in the estimates and the plot progressively
+        self.window.after_idle(self.load_models)
+        if self.profile_box is not None:
+            self.window.after(PROFILE_POLL_MS, self.poll_profiles)
+        if self.server is not None:
+            self.window.after(INGEST_POLL_MS, self.poll_readings)
 
         # Display the GUI
-        self.window.lift()
-        self.window.focus_force()
-        self.window.mainloop()
+        if start:
+            self.window.lift()
+            self.window.focus_force()
+            self.window.mainloop()
 
     def run(self):
         self.window.mainloop()
 
+    def on_close(self):
+        if self.server is not None:
+            self.server.stop()
+            self.apply_readings()
+        self.plot_loader.shutdown()
+        self.profiles.close()
+        self.window.destroy()
+
+    def use_profile(self, profile):
+        self.profile = profile
+        self.twitch_points_list = profile.twitch_points_list
+        self.twitch_points_models = profile.models
+        self.storage = profile.storage
+        self.persistence = profile.persistence
+
+    def top_streamer(self):
+        """
+        :return: the streamer with the most points, None without streamers
+        """
+        top_streamer = None
+        if len(self.twitch_points_list.streamers) > 0:
+            top_streamer = self.twitch_points_list.streamers[0]
+            for streamer in self.twitch_points_list.streamers:
+                if streamer.points[-1] > top_streamer.points[-1]:
+                    top_streamer = streamer
+        return top_streamer
+
+    def poll_profiles(self):
+        """
+        Offer the profiles that finished loading, until none is loading anymore.
+        """
+        for name, future in self.profiles.futures.items():
+            if future.done() and future.exception() is not None and name not in self.failed_profiles:
+                self.failed_profiles.add(name)
+                print(f"Loading profile {name} failed: {future.exception()}")
+        self.profile_box.configure(values=self.profiles.loaded())
+        if self.profiles.pending():
+            self.window.after(PROFILE_POLL_MS, self.poll_profiles)
+
+    def poll_readings(self):
+        """
+        The server thread only queues readings, they are applied here so that the streamers are only edited
+        by the Tk thread. Everything queued since the last poll is one micro-batch.
+        """
+        try:
+            if not self.server.readings.empty():
+                self.apply_readings()
+        finally:
+            # A failing batch must not stop the ingestion
+            self.window.after(INGEST_POLL_MS, self.poll_readings)
+
+    @interaction("ingest")
+    def apply_readings(self):
+        loaded = {name: self.profiles.profiles[name] for name in self.profiles.loaded()}
+        streamers = self.server.apply_pending(loaded).get(self.profile.name)
+        if not streamers:
+            return
+        for streamer in streamers:
+            self.table.refresh_streamer(streamer)
+        self.table.refresh_table()
+        if self.plotted_streamer is None:
+            self.plotted_streamer = self.top_streamer()
+        if self.plotted_streamer in streamers:
+            self.refresh_plot(self.plotted_streamer)
+
+    @interaction("switch_profile")
+    def switch_profile(self, event=None):
+        """
+        Show another loaded profile. Profiles stay in memory, so nothing is read from disk.
+        """
+        profile = self.profiles.profiles[self.profile_box.get()]
+        if profile is self.profile:
+            return
+        self.use_profile(profile)
+        if not profile.fitted:
+            profile.fit()
+        self.window.title(f"Twitch Points - {profile.name}")
+        self.table.show_list(self.twitch_points_list)
+        self.plotted_streamer = self.top_streamer()
+        if self.plotted_streamer is not None:
+            self.refresh_plot(self.plotted_streamer)
+
+    @interaction("click")
     def on_click(self, event):
         region_clicked = self.table.treeview.identify("region", event.x, event.y)
         if region_clicked != "cell":
             return
         row_id = self.table.treeview.identify_row(event.y)
-        row = self.table.treeview.item(row_id)["values"]
-        streamer_name = str(row[1])
-        self.plotted_streamer = self.twitch_points_list.get_entry(streamer_name)
+        self.plot_row(row_id)
+
+    @interaction("key_select")
+    def on_key_select(self, event):
+        row_id = self.table.treeview.focus()
+        if row_id:
+            self.plot_row(row_id)
+
+    def plot_row(self, row_id):
+        streamer = self.table.streamer_at(row_id)
+        if streamer is None:
+            return
+        self.plotted_streamer = streamer
         self.refresh_plot(self.plotted_streamer)
+        # Prepare the rows around it, so moving through the table with the arrow keys shows them right away
+        if self.plot is not None:
+            self.plot_loader.prefetch(self.storage, self.table.neighbours(streamer), self.plot.width)
 
     def on_double_click(self, event):
         region_clicked = self.table.treeview.identify("region", event.x, event.y)
@@ -100,8 +222,9 @@ class TwitchPointsGUI:
             return
         column_id = self.table.treeview.identify_column(event.x)
         row_id = self.table.treeview.identify_row(event.y)
-        row = self.table.treeview.item(row_id)["values"]
-        streamer = self.twitch_points_list.get_entry(row[1])
+        streamer = self.table.streamer_at(row_id)
+        if streamer is None:
+            return
 
         if column_id in ["#2", "#3", "#4"]:  # Streamer name
             selected_text = self.table.treeview.item(row_id)["values"][int(column_id[1]) - 1]
@@ -121,49 +244,33 @@ class TwitchPointsGUI:
         entry_widget.bind("<Escape>", lambda event: event.widget.destroy())
         entry_widget.bind("<Return>", lambda event: self.on_return(event, streamer, column_id))
 
+    @interaction("edit")
     def on_return(self, event, streamer, column_id):
         if column_id == "#2":
-            old_name = streamer.name
-            streamer.name = event.widget.get()
-            self.twitch_points_models.models[streamer] = self.twitch_points_models.models.pop(old_name)
+            try:
+                self.twitch_points_list.rename_entry(streamer, event.widget.get(), self.twitch_points_models.models)
+            except ValueError as e:
+                messagebox.showerror("Rename Streamer", str(e))
+                event.widget.destroy()
+                return
         elif column_id == "#3":
             streamer.add_entry(int(event.widget.get()), datetime.now())
+            # Saved first, storages that write right away are queried by the refit
+            self.persistence.mark_dirty(streamer)
             self.twitch_points_models.construct_model(streamer)
-            self.twitch_points_models.save_models()
-            self.twitch_points_list.save_to_file(self.current_file)
             streamer.est_date = self.twitch_points_models.when_target(streamer)
             print("Adding streamer entry:")
-            print(streamer.name, streamer.points[-1], streamer.target, str(streamer.dates[-1]))
+            print(streamer.name, streamer.points[-1], streamer.target, str(streamer.last_date))
         elif column_id == "#4":
             streamer.target = int(event.widget.get())
             streamer.est_date = self.twitch_points_models.when_target(streamer)
-            self.twitch_points_list.save_to_file(self.current_file)
-        self.table.refresh_df()
+        self.persistence.mark_dirty(streamer)
+        self.table.refresh_streamer(streamer)
         self.table.refresh_table()
         self.refresh_plot(self.plotted_streamer)
 
         event.widget.destroy()
 
-    def create_streamer_plot(self, streamer, height_px=420):
-        # Create a frame for the plot
-        plot_frame = tk.Frame(self.window, bg="#383838")
-        model = self.twitch_points_models.models[streamer]
-
-        # Create the Matplotlib plot
-        plot_buffer = streamer.get_plot(model, height_px, background_color="#383838")  # Assuming get_plot() returns the image buffer
-        plot_img = Image.open(plot_buffer)
-        plot_img_tk = ImageTk.PhotoImage(plot_img)
-
-        # Create a Canvas widget to display the plot
-        canvas = tk.Canvas(plot_frame, bg="#ffffff", width=plot_img.width, height=plot_img.height, highlightthickness=0)
-        canvas.pack(expand=True, fill="both")
-
-        # Display the plot image on the canvas
-        canvas.create_image(0, 0, anchor="nw", image=plot_img_tk)
-
-        # Return the plot frame and plot image Tk object
-        return plot_frame, plot_img_tk
-
     def create_control_buttons(self, frame):
         # Create the button frame within the bottom left frame
         button_frame = tk.Frame(frame, bg="#383838")
@@ -177,6 +284,20 @@ class TwitchPointsGUI:
         delete_button = tk.Button(button_frame, text="Delete", command=self.delete_streamer, bg="#383838", fg="white")
         delete_button.pack()
 
+        # Export button
+        export_button = tk.Button(button_frame, text="Export plot", command=self.export_plot, bg="#383838",
+                                  fg="white")
+        export_button.pack()
+
+        # Profile selection, filled in as the profiles finish loading
+        if len(self.profiles.profiles) > 1:
+            profile_label = tk.Label(button_frame, text="Profile", bg="#383838", fg="white")
+            profile_label.pack()
+            self.profile_box = ttk.Combobox(button_frame, state="readonly", values=self.profiles.loaded(), width=18)
+            self.profile_box.set(self.profile.name)
+            self.profile_box.bind("<<ComboboxSelected>>", self.switch_profile)
+            self.profile_box.pack()
+
         # Name label and entry
         name_label = tk.Label(add_frame, text="Name", bg="#383838", fg="white")
         name_label.pack()
@@ -199,50 +320,94 @@ class TwitchPointsGUI:
         add_button = tk.Button(add_frame, text="Add", command=self.add_streamer, bg="#383838", fg="white")
         add_button.pack()
 
+    @interaction("add_streamer")
     def add_streamer(self):
         streamer = Streamer(str(self.name_entry.get()),
                             int(self.points_entry.get()),
                             datetime.now(),
                             int(self.target_entry.get()))
-        self.twitch_points_list.add_entry(streamer)
+        streamer = self.twitch_points_list.add_entry(streamer)
+        # Saved first, storages that write right away are queried by the refit
+        self.persistence.mark_dirty(streamer)
 
         self.twitch_points_models.construct_model(streamer)
         streamer.est_date = self.twitch_points_models.when_target(streamer)
+        self.persistence.mark_models(streamer)
 
-        self.table.refresh_df()
+        self.table.refresh_streamer(streamer)
         self.table.refresh_table()
-        self.twitch_points_models.save_models()
-        self.twitch_points_list.save_to_file(self.current_file)
 
         self.name_entry.delete(0, 'end')
         self.points_entry.delete(0, 'end')
         self.target_entry.delete(0, 'end')
 
+    @interaction("delete_streamer")
     def delete_streamer(self):
-        selected = self.table.treeview.selection()
+        streamer = self.table.selected
 
-        if selected:
+        if streamer:
             # open pop up box to verify deletion
-            if not messagebox.askokcancel("Delete Streamer", "Are you sure you want to delete this streamer?"):
+            if not messagebox.askokcancel("Delete Streamer", f"Are you sure you want to delete {streamer.name}?"):
                 return
-            streamer_name = str(self.table.treeview.item(selected[0])["values"][1])
-            streamer = self.twitch_points_list.get_entry(streamer_name)
             self.twitch_points_list.remove_entry(streamer)
-            self.twitch_points_models.remove_model(streamer)
+            # The model record is dropped by the next save
+            self.twitch_points_models.remove_model(streamer, save=False)
 
-            self.table.refresh_df()
+            self.table.remove_streamer(streamer)
             self.table.refresh_table()
-            self.twitch_points_models.save_models()
-            self.twitch_points_list.save_to_file(self.current_file)
+            self.persistence.mark_dirty()
+
+    @span("load_models")
+    def load_models(self):
+        if not self.profile.fitted:
+            self.profile.fit()
+
+        self.table.refresh_index()
+        self.table.refresh_table()
+        self.window.after_idle(self.load_plot)
 
-    def refresh_plot(self, streamer, height_px=420):
-        # Create a new plot frame for the updated streamer
-        new_plot_frame, new_plot_img_tk = self.create_streamer_plot(streamer, height_px)
-        new_plot_frame.grid(row=0, column=1, sticky="nsew")
+    @span("load_plot")
+    def load_plot(self):
+        # matplotlib is imported here rather than at startup, it is the slowest import of the program
+        from gui.twitch_points_plot import TwitchPointsPlot
 
-        if self.plot_frame:
-            self.plot_frame.destroy()
+        self.plot = TwitchPointsPlot(self.window, height_px=420, background_color="#383838")
+        self.plot.widget.grid(row=0, column=1, sticky="nsew")
+        if self.plotted_streamer:
+            self.refresh_plot(self.plotted_streamer)
+
+    def refresh_plot(self, streamer):
+        """
+        Show the plot of a streamer once its entries are queried and downsampled on the plot loader's thread.
+        """
+        if self.plot is None or not self.profile.fitted:
+            # Shown by load_plot
+            return
+        # The interaction that asked for the plot ends when it is drawn
+        finish = defer_interaction()
+        self.plot_loader.request(self.storage, streamer, self.plot.width,
+                                 lambda series, line, filled: self.show_plot(streamer, series, line, filled, finish))
+
+    def show_plot(self, streamer, series, line, filled, finish=None):
+        """
+        :param finish: ends the interaction that requested the plot, see defer_interaction
+        """
+        if streamer is not self.plotted_streamer:
+            return
+        self.plot.show(streamer, self.twitch_points_models.models.get(streamer), series, (line, filled))
+        if finish is not None:
+            finish()
 
-        # Update the reference to the new plot frame and plot image Tk object
-        self.plot_frame = new_plot_frame
-        self.plot_img_tk = new_plot_img_tk
+    @interaction("export_plot")
+    def export_plot(self):
+        if not self.plotted_streamer:
+            return
+        filename = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("PNG", "*.png")],
+                                                initialfile=f"{self.plotted_streamer.name}.png")
+        if not filename:
+            return
+        model = self.twitch_points_models.models[self.plotted_streamer]
+        plot_buffer = self.plotted_streamer.get_plot(model, 420, background_color="#383838",
+                                                     series=self.storage.entries(self.plotted_streamer))
+        with open(filename, "wb") as file:
+            file.write(plot_buffer.getvalue())
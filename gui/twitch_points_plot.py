@@ -0,0 +1,138 @@
+import numpy as np
+from matplotlib import dates as mdates
+from matplotlib import pyplot as plt
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+from twitch_points_list import evenly_spaced_list
+from twitch_points_series import US_PER_SECOND
+from twitch_points_trace import span
+
+
+class TwitchPointsPlot:
+    """
+    Points over time plot embedded in Tk.
+    The figure and its artists are created once, showing another streamer only swaps their data.
+    When the axes do not change, the data artists are redrawn with blitting.
+    """
+
+    def __init__(self, parent, height_px=420, background_color="#383838"):
+        # Calculate the width based on the desired height and the aspect ratio (16:9)
+        width_px = int(height_px * (16 / 9))
+
+        with plt.style.context('dark_background'):
+            self.figure = Figure(figsize=(width_px / 100, height_px / 100), dpi=100, facecolor=background_color)
+            self.ax = self.figure.add_subplot()
+            self.ax.set_facecolor(background_color)
+
+            self.points_line, = self.ax.plot([], [],
+                                             marker='o',
+                                             color='lightblue',
+                                             label='Points',
+                                             markerfacecolor=background_color,
+                                             markeredgewidth=1.3)
+            # Last entry of each day
+            self.filled_points, = self.ax.plot([], [], marker='o', linestyle='', color='lightblue')
+            self.prediction_line, = self.ax.plot([], [], linestyle='-', color='orange', label='Prediction')
+            self.ax.legend()
+
+            self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+            self.ax.set_xlabel('Date', color='white')
+            self.ax.set_ylabel('Points', color='white')
+            self.title = self.ax.set_title('', color='white')
+            self.annotation = self.ax.text(0, 1.047, '',
+                                           horizontalalignment='left',
+                                           verticalalignment='center',
+                                           transform=self.ax.transAxes,
+                                           fontsize=8,
+                                           color='lightgray')
+
+        self.animated = [self.points_line, self.filled_points, self.prediction_line, self.title, self.annotation]
+        for artist in self.animated:
+            artist.set_animated(True)
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=parent)
+        self.widget = self.canvas.get_tk_widget()
+        self.widget.configure(bg=background_color, highlightthickness=0)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+        self.background = None
+        self.axes_state = None
+
+    def on_draw(self, event):
+        # Keep the static part of the figure for blitting, then draw the data on top of it
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for artist in self.animated:
+            self.figure.draw_artist(artist)
+
+    @property
+    def width(self):
+        """
+        Width of the plot in pixels, about the number of points that can be drawn.
+        """
+        return int(self.figure.bbox.width)
+
+    @span("plot_show")
+    def show(self, streamer, model=None, series=None, indices=None):
+        """
+        Show the plot of a streamer.
+        :param streamer: Streamer
+        :param model: model of the streamer, the prediction line is hidden without one
+        :param series: PointsSeries of the entries to draw, e.g. from Storage.entries,
+                       all entries of the streamer when None
+        :param indices: (line, filled) positions from series.plot_indices, e.g. prepared by PlotLoader,
+                        computed when None
+        """
+        if series is None:
+            series = streamer.series
+        self.title.set_text(f'Points Over Time - {streamer.name}')
+        self.annotation.set_text(streamer.target_annotation())
+        if not len(series):
+            # No entries to draw, e.g. a streamer the storage has not written yet
+            for artist in (self.points_line, self.filled_points, self.prediction_line):
+                artist.set_data([], [])
+            self.axes_state = None
+            self.ax.set_yticks([])
+            self.canvas.draw_idle()
+            return
+
+        # Long histories are downsampled to about one point per pixel column
+        line, filled = series.plot_indices(self.width) if indices is None else indices
+        dates = series.dates
+        x_line = mdates.date2num(dates[line])
+        points = series.points
+        self.points_line.set_data(x_line, points[line])
+        self.filled_points.set_data(mdates.date2num(dates[filled]), points[filled])
+
+        has_prediction = model is not None and np.ravel(model.coef_)[0] != 0
+        if has_prediction:
+            # The prediction is a straight line, its endpoints are enough
+            ends = line[[0, -1]]
+            y_values = model.predict((series.timestamps[ends] / US_PER_SECOND).reshape(-1, 1))
+            self.prediction_line.set_data(x_line[[0, -1]], np.ravel(y_values))
+        else:
+            self.prediction_line.set_data([], [])
+
+        num_ticks = 5
+        low, high = int(points.min()), int(points.max())
+        tick_positions = np.linspace(low, high, num_ticks)
+        axes_state = (x_line[0], x_line[-1], low, high, has_prediction)
+        if axes_state == self.axes_state and self.background is not None:
+            self.canvas.restore_region(self.background)
+            self.draw_animated()
+            self.canvas.blit(self.figure.bbox)
+            return
+
+        self.axes_state = axes_state
+        self.ax.set_yticks(tick_positions)
+        ytick_labels = evenly_spaced_list(low, high, num_ticks)
+        self.ax.set_yticklabels([format(int(label), ",").replace(",", " ") for label in ytick_labels])
+        self.ax.relim()
+        self.ax.autoscale_view()
+        handles = [self.points_line, self.prediction_line] if has_prediction else [self.points_line]
+        with plt.style.context('dark_background'):
+            self.ax.legend(handles=handles)
+        self.canvas.draw_idle()
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from twitch_points_series import PointsSeries
+from twitch_points_trace import span
+
+
+class EntriesSnapshot:
+    """
+    The entries of a streamer when its plot was requested, queried on the loader thread in its place.
+    Series only grow and filled entries never change, so views of them stay valid while the streamer is edited.
+    """
+    __slots__ = ("name", "history", "timestamps", "points", "_series")
+
+    def __init__(self, streamer):
+        self.name = streamer.name
+        self.history = streamer.history
+        self.timestamps = streamer.timestamps
+        self.points = streamer.points
+        self._series = None
+
+    @property
+    def series(self):
+        # The daily index is rebuilt on the loader thread
+        if self._series is None:
+            self._series = PointsSeries.from_arrays(self.timestamps, self.points)
+        return self._series
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+@span("prepare_plot")
+def prepare_plot(storage, snapshot, width):
+    """
+    :return: (series, line positions, positions of the last entries of days), see PointsSeries.plot_indices
+    """
+    series = storage.entries(snapshot)
+    line, filled = series.plot_indices(width)
+    return series, line, filled
+
+
+class PlotLoader:
+    """
+    Prepares the data of plots on a worker thread and hands it back to the Tk loop with after():
+    the storage query of a streamer's entries, which reads the database with SQLite, and the downsampling
+    to the plot width. Only the latest requested plot is delivered, older requests are cancelled.
+    The rows around the selection are prepared ahead, so moving through the table shows them right away.
+    """
+
+    def __init__(self, window, poll_ms=20, cache_size=8):
+        """
+        :param window: Tk window whose loop receives the results
+        :param poll_ms: how often pending results are checked
+        :param cache_size: number of prepared plots kept
+        """
+        self.window = window
+        self.poll_ms = poll_ms
+        self.cache_size = cache_size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plot")
+        self.prepared = OrderedDict()  # key -> (series, line, filled), least recently used first
+        self.futures = {}  # key -> future of a requested or prefetched plot
+        self.current = None  # (key, callback) of the plot to be shown
+        self.polling = False
+
+    @staticmethod
+    def key(storage, streamer, width):
+        # The entries of a streamer only change by appending, so their number identifies them
+        return id(storage), streamer.name, len(streamer), width
+
+    def request(self, storage, streamer, width, callback):
+        """
+        Prepare the plot of a streamer and pass its data to callback on the Tk loop,
+        right away when it was prepared ahead.
+        :param storage: Storage of the streamer
+        :param width: plot width in pixels
+        :param callback: function taking the series, the line positions and the positions of the last entries of days
+        """
+        key = self.key(storage, streamer, width)
+        for pending in [pending for pending in self.futures if pending != key]:
+            if self.futures[pending].cancel():
+                del self.futures[pending]
+
+        data = self.prepared.get(key)
+        if data is not None:
+            self.prepared.move_to_end(key)
+            self.current = None
+            callback(*data)
+            return
+        self.current = (key, callback)
+        self._submit(key, storage, streamer, width)
+        self._schedule_poll()
+
+    def prefetch(self, storage, streamers, width):
+        """
+        Prepare plots in the background so that requesting them later is instant.
+        :param storage: Storage of the streamers
+        :param streamers: streamers to prepare, closest rows first
+        :param width: plot width in pixels
+        """
+        for streamer in streamers:
+            key = self.key(storage, streamer, width)
+            if key not in self.prepared:
+                self._submit(key, storage, streamer, width)
+        self._schedule_poll()
+
+    def _submit(self, key, storage, streamer, width):
+        if key not in self.futures:
+            self.futures[key] = self.executor.submit(prepare_plot, storage, EntriesSnapshot(streamer), width)
+
+    def _schedule_poll(self):
+        if not self.polling and self.futures:
+            self.polling = True
+            self.window.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self.polling = False
+        for key, future in list(self.futures.items()):
+            if not future.done():
+                continue
+            del self.futures[key]
+            if future.cancelled():
+                continue
+            if future.exception() is not None:
+                print(f"Preparing the plot of {key[1]} failed: {future.exception()}")
+                continue
+            self.prepared[key] = future.result()
+            while len(self.prepared) > self.cache_size:
+                self.prepared.popitem(last=False)
+
+        if self.current is not None:
+            key, callback = self.current
+            data = self.prepared.get(key)
+            if data is not None:
+                self.current = None
+                callback(*data)
+            elif key not in self.futures:
+                # Failed
+                self.current = None
+
+        self._schedule_poll()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.current = None
+        self.futures.clear()
@@ -1,7 +1,10 @@
 import tkinter as tk
+from bisect import bisect_left
 from tkinter import ttk
 from datetime import datetime
 from twitch_points_list import TwitchPointsList
+from twitch_points_sort_index import SortIndex
+from twitch_points_trace import interaction, span
 
 colors = ["orange red",
           "tomato",
@@ -14,6 +17,8 @@ colors = ["orange red",
           "green3",
           "green4",
           "cyan2"]
+# Rows of streamers without a target
+no_target_color = "light gray"
 
 
 def get_column_index(column_name):
@@ -54,10 +59,80 @@ def sort_table(lst, column, reverse=False):
     return sorted(lst, key=lambda x: x[column_index], reverse=reverse)
 
 
+def format_row(rank, streamer):
+    """
+    Format a table row.
+
+    Args:
+    - rank (int): The position of the row in the table, starting at 1.
+    - streamer (Streamer): The streamer of the row.
+
+    Returns:
+    - tuple: The row values and the color tag of the row.
+    """
+    if streamer.est_date is None:
+        # Not estimated yet, models are loaded after the table is shown
+        est_date = "..."
+    elif streamer.est_date == datetime.max:
+        est_date = "N/A"
+    else:
+        est_date = streamer.est_date.strftime('%H:%M:%S %d-%m-%Y')
+    target = format(streamer.target, ',').replace(',', ' ') if streamer.target is not None else "N/A"
+    percentage = streamer.percentage
+    if percentage is None:
+        percentage = "N/A"
+        color = no_target_color
+    else:
+        color = colors[min(int(percentage / 10), len(colors) - 1)]
+        percentage = format(percentage, '.2f') + "%"
+    values = (rank,
+              streamer.name,
+              format(int(streamer.points[-1]), ',').replace(',', ' '),
+              target,
+              percentage,
+              est_date)
+    return values, color
+
+
+def longest_increasing_subsequence(sequence):
+    """
+    Find a longest strictly increasing subsequence.
+
+    Args:
+    - sequence (list): The list of comparable values.
+
+    Returns:
+    - set: The indices of the subsequence elements in the list.
+    """
+    tails = []  # tails[k]: index of the smallest tail of an increasing subsequence of length k + 1
+    tail_values = []
+    previous = [-1] * len(sequence)
+    for i, value in enumerate(sequence):
+        k = bisect_left(tail_values, value)
+        previous[i] = tails[k - 1] if k > 0 else -1
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k] = i
+            tail_values[k] = value
+
+    indices = set()
+    i = tails[-1] if tails else -1
+    while i != -1:
+        indices.add(i)
+        i = previous[i]
+    return indices
+
+
+# Tables with more streamers only materialize the visible rows
+VIRTUAL_THRESHOLD = 500
+
+
 class TwitchPointsTable:
-    def __init__(self, parent, twitch: TwitchPointsList):
+    def __init__(self, parent, twitch: TwitchPointsList, virtual=None, height=20, overscan=10):
         self.twitch = twitch
-        self.df = twitch.to_df()
+        self.sort_index = SortIndex(twitch.streamers)
         self.window = parent
 
         self.up_triangle = tk.PhotoImage(file="gui/up_triangle.png")
@@ -66,9 +141,25 @@ class TwitchPointsTable:
         self.current_sort_column = "percentage"
         self.sort_ascending = False
 
+        # Virtual mode keeps only the rows from offset - overscan to offset + height + overscan in the Treeview
+        self.virtual = len(twitch.streamers) > VIRTUAL_THRESHOLD if virtual is None else virtual
+        self.height = height
+        self.overscan = overscan
+        self.offset = 0
+        # Selected streamer, kept while its row is scrolled out of the Treeview in virtual mode
+        self.selected = None
+
+        # Item -> [values, color] of the rows in the Treeview, items are named after the streamer's sequence
+        # in the sort index, so they identify the streamer rather than a position
+        self.rows = {}
+        # Items in the order they are displayed
+        self.items = []
+
+        self.frame = tk.Frame(self.window, bg="#383838")
+
         # Streamers table
-        self.treeview = ttk.Treeview(self.window, columns=("#", "name", "points", "target", "percentage", "est_date"),
-                                     show="headings", height=20)
+        self.treeview = ttk.Treeview(self.frame, columns=("#", "name", "points", "target", "percentage", "est_date"),
+                                     show="headings", height=height)
         self.column_names = {"#": "#",
                              "name": " Streamer",
                              "points": " Points",
@@ -101,39 +192,205 @@ class TwitchPointsTable:
 
         self.treeview.focus_set()
 
+        for color in colors + [no_target_color]:
+            self.treeview.tag_configure(color, background=color)
+
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical")
+        if self.virtual:
+            self.scrollbar.configure(command=self.yview)
+            self.treeview.bind("<MouseWheel>", lambda event: self.scroll(-3 if event.delta > 0 else 3))
+            self.treeview.bind("<Button-4>", lambda event: self.scroll(-3))
+            self.treeview.bind("<Button-5>", lambda event: self.scroll(3))
+        else:
+            self.scrollbar.configure(command=self.treeview.yview)
+            self.treeview.configure(yscrollcommand=self.scrollbar.set)
+        self.treeview.bind("<<TreeviewSelect>>", self.on_select, add="+")
+        self.treeview.grid(row=0, column=0)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
         self.refresh_table()
 
+    @span("refresh_table")
     def refresh_table(self):
-        self.treeview.delete(*self.treeview.get_children())
-        self.df = self.df.sort_values(by=self.current_sort_column, ascending=self.sort_ascending)
-        for i, entry in enumerate(self.df.itertuples(), start=1):
-            user = entry.name
-            points = entry.points
-            target = entry.target
-            percentage = entry.percentage
-            est_date = entry.est_date.strftime('%H:%M:%S %d-%m-%Y') if entry.est_date != datetime.max else "N/A"
-
-            color = colors[min(int(percentage / 10), len(colors) - 1)]
-            self.treeview.insert("", "end", values=(i,
-                                                    user,
-                                                    format(points, ',').replace(',', ' '),
-                                                    format(target, ',').replace(',', ' '),
-                                                    format(percentage, '.2f') + "%",
-                                                    est_date),
-                                 tags=(color,))
-
-        for color in colors:
-            self.treeview.tag_configure(color, background=color)
+        """
+        Bring the Treeview in line with the sort index.
+        Rows keep their item across refreshes, so only the cells and tags that changed are updated,
+        and rows that changed position are moved instead of rebuilding the table.
+        In virtual mode only the rows around the scroll offset are in the Treeview.
+        """
+        count = len(self.sort_index)
+        if self.virtual:
+            self.offset = max(0, min(self.offset, count - self.height))
+            start = max(0, self.offset - self.overscan)
+            stop = min(count, self.offset + self.height + self.overscan)
+        else:
+            start, stop = 0, count
+
+        order = []
+        window = self.sort_index.window(self.current_sort_column, self.sort_ascending, start, stop)
+        for rank, (sequence, streamer) in enumerate(window, start=start + 1):
+            values, color = format_row(rank, streamer)
+            item = f"s{sequence}"
+            row = self.rows.get(item)
+            if row is None:
+                self.treeview.insert("", "end", iid=item, values=values, tags=(color,))
+                self.rows[item] = [values, color]
+                self.items.append(item)
+            else:
+                if row[0] != values:
+                    self.treeview.item(item, values=values)
+                    row[0] = values
+                if row[1] != color:
+                    self.treeview.item(item, tags=(color,))
+                    row[1] = color
+            order.append(item)
+
+        present = set(order)
+        for item in [item for item in self.rows if item not in present]:
+            self.treeview.delete(item)
+            self.items.remove(item)
+            del self.rows[item]
+
+        self.move_rows(order)
+
+        if self.virtual:
+            self.treeview.yview_moveto((self.offset - start) / max(stop - start, 1))
+            self.scrollbar.set(self.offset / max(count, 1), min(self.offset + self.height, count) / max(count, 1))
+            item = self.item_of(self.selected)
+            if item in present and item not in self.treeview.selection():
+                self.treeview.selection_set(item)
+
+    def item_of(self, streamer):
+        if streamer is None or streamer not in self.sort_index:
+            return None
+        return f"s{self.sort_index.sequences[id(streamer)]}"
+
+    def streamer_at(self, item):
+        """
+        Get the streamer of a Treeview item.
+
+        Args:
+        - item (str): The Treeview item.
+
+        Returns:
+        - Streamer: The streamer, or None if the item is not a row.
+        """
+        if not item:
+            return None
+        return self.sort_index.streamers.get(int(item[1:]))
+
+    def neighbours(self, streamer, count=1):
+        """
+        Get the streamers in the rows around a streamer's row, in the displayed order.
+
+        Args:
+        - streamer (Streamer): The streamer of the row.
+        - count (int): The number of rows to take above and below.
 
-    def refresh_df(self):
-        self.df = self.twitch.to_df()
+        Returns:
+        - list: The streamers, closest rows first.
+        """
+        if streamer not in self.sort_index:
+            return []
+        position = self.sort_index.position(streamer, self.current_sort_column, self.sort_ascending)
+        start = max(0, position - count)
+        window = self.sort_index.window(self.current_sort_column, self.sort_ascending, start, position + count + 1)
+        rows = [other for _, other in window]
+        return sorted((other for other in rows if other is not streamer),
+                      key=lambda other: abs(rows.index(other) + start - position))
+
+    def on_select(self, event):
+        selection = self.treeview.selection()
+        if not selection:
+            # In virtual mode the selected row may only have been scrolled out of the Treeview,
+            # otherwise the row was deselected
+            if not self.virtual or self.item_of(self.selected) in self.rows:
+                self.selected = None
+            return
+        self.selected = self.streamer_at(selection[0])
+        if self.virtual:
+            # Keyboard navigation can select rows in the overscan, scroll them into view
+            position = self.sort_index.position(self.selected, self.current_sort_column, self.sort_ascending)
+            if position < self.offset:
+                self.scroll_to(position)
+            elif position >= self.offset + self.height:
+                self.scroll_to(position - self.height + 1)
+
+    def scroll_to(self, offset):
+        self.offset = offset
+        self.refresh_table()
+
+    @interaction("scroll")
+    def scroll(self, rows):
+        self.scroll_to(self.offset + rows)
+        return "break"
+
+    def yview(self, *args):
+        """
+        Scrollbar command of the virtual mode, maps the scrollbar position to the scroll offset.
+        """
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * len(self.sort_index)))
+        elif args[0] == "scroll":
+            rows = int(args[1]) * (self.height if args[2] == "pages" else 1)
+            self.scroll_to(self.offset + rows)
+
+    def move_rows(self, order):
+        """
+        Reorder the Treeview items with as few moves as possible.
+        Items on a longest increasing subsequence of current positions stay in place, every other item
+        is moved right after its predecessor in the new order.
+
+        Args:
+        - order (list): The items in their new order.
+        """
+        positions = {item: i for i, item in enumerate(self.items)}
+        staying = longest_increasing_subsequence([positions[item] for item in order])
+        for i, item in enumerate(order):
+            if i in staying:
+                continue
+            self.items.remove(item)
+            index = self.items.index(order[i - 1]) + 1 if i > 0 else 0
+            self.items.insert(index, item)
+            self.treeview.detach(item)
+            self.treeview.move(item, "", index)
+
+    def refresh_streamer(self, streamer):
+        """
+        Update the position of an added or edited streamer in the sort index.
+        """
+        self.sort_index.update(streamer)
+
+    def remove_streamer(self, streamer):
+        if streamer is self.selected:
+            self.selected = None
+        self.sort_index.remove(streamer)
+
+    def refresh_index(self):
+        """
+        Rebuild the sort index from all streamers.
+        """
+        self.sort_index.sync(self.twitch.streamers)
+
+    def show_list(self, twitch: TwitchPointsList):
+        """
+        Show the streamers of another list, e.g. of another profile. The sort column stays.
+        """
+        self.twitch = twitch
+        self.sort_index = SortIndex(twitch.streamers)
+        self.treeview.delete(*self.rows)
+        self.rows.clear()
+        self.items.clear()
+        self.offset = 0
+        self.selected = None
+        self.refresh_table()
 
+    @interaction("sort_column")
     def sort_column(self, column):
         if column == self.current_sort_column:
             self.sort_ascending = not self.sort_ascending
         else:
             self.sort_ascending = False
-        self.df = self.df.sort_values(by=column, ascending=self.sort_ascending)
         self.current_sort_column = column
 
         # Update the table widget with the sorted data
@@ -1,27 +1,49 @@
-from os.path import isfile
+import argparse
 
-from twitch_points_models import TwitchPointsModels
-from twitch_points_list import TwitchPointsList
+from twitch_points_profiles import DEFAULT_PROFILE, Profile, ProfileManager
+from twitch_points_storage import open_storage
+import twitch_points_trace
 from gui.twitch_points_gui import TwitchPointsGUI
 
 if __name__ == "__main__":
     print("Twitch Points Tracker")
 
-    twitch_points = TwitchPointsList()
-    if isfile("twitch_points.csv"):
-        twitch_points.load_from_file("twitch_points.csv")
+    parser = argparse.ArgumentParser(description="Twitch Points Tracker")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="time the hot paths and interactions, and write the histograms to FILE on exit")
+    parser.add_argument("--profile", metavar="N", type=int, default=0,
+                        help="with --trace, keep cProfile statistics of the N slowest interactions")
+    parser.add_argument("--tail", action="store_true",
+                        help="keep only the last 30 days of each streamer in memory, older entries are read "
+                             "from disk for the plot")
+    parser.add_argument("--serve", metavar="PORT", type=int,
+                        help="accept readings posted to http://127.0.0.1:PORT/readings, see twitch_points_server")
+    parser.add_argument("--serve-unix", metavar="PATH", help="accept readings on a Unix socket instead")
+    args = parser.parse_args()
+    if args.trace:
+        twitch_points_trace.enable(args.trace, args.profile)
     else:
-        twitch_points = TwitchPointsList()
+        twitch_points_trace.enable_from_environment()
 
-    twitch_points_models = TwitchPointsModels()
-    if isfile("models.pkl"):
-        twitch_points_models.load_models()
-    else:
-        twitch_points_models = TwitchPointsModels()
-    for streamer in twitch_points.streamers:
-        if streamer not in twitch_points_models.models:
-            twitch_points_models.construct_model(streamer)
-    for streamer in twitch_points.streamers:
-        streamer.est_date = twitch_points_models.when_target(streamer)
-
-    TwitchPointsGUI(twitch_points, twitch_points_models)
+    # twitch_points.db when it was created with python twitch_points_sqlite.py import,
+    # otherwise twitch_points.csv with twitch_points.bin as a binary copy that is much faster to open
+    storage = open_storage(tail=args.tail)
+    # Other accounts are tracked in profiles/, see twitch_points_profiles
+    profiles = ProfileManager.discover(Profile(DEFAULT_PROFILE, storage), tail=args.tail)
+
+    # The window opens once the default profile is loaded, its models are fitted after the first paint.
+    # The other profiles load in the background meanwhile.
+    default = profiles.load(DEFAULT_PROFILE, fit=False)
+    profiles.load_all()
+    default.result()
+
+    server = None
+    if args.serve is not None or args.serve_unix:
+        # asyncio is only imported when serving
+        from twitch_points_server import IngestServer
+
+        server = IngestServer(port=args.serve or 0, unix_path=args.serve_unix, default_profile=DEFAULT_PROFILE)
+        server.start_thread()
+        print(f"Accepting readings on {args.serve_unix or f'{server.host}:{server.port}'}")
+
+    TwitchPointsGUI(profiles, server=server)
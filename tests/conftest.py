@@ -0,0 +1,58 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# The modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twitch_points_list import Streamer, TwitchPointsList  # noqa: E402
+from twitch_points_series import to_timestamp  # noqa: E402
+
+START = datetime(2024, 1, 1, 18)
+
+
+def make_streamer(name, days, burst=3, rate=1000, target=None, gaps=(), spend_day=None):
+    """
+    A streamer watched every day except the gaps, with 1 to burst readings ten minutes apart on a day.
+    Points grow by rate a day and 10 a reading, and are halved on spend_day.
+    """
+    timestamps, points = [], []
+    current = 1000
+    for day in range(days):
+        if day in gaps:
+            continue
+        current = current // 2 if day == spend_day else current + rate
+        for reading in range(1 + day % burst):
+            current += 10
+            timestamps.append(to_timestamp(START + timedelta(days=day, minutes=10 * reading)))
+            points.append(current)
+    return Streamer.from_arrays(name, timestamps, points, target)
+
+
+@pytest.fixture
+def twitch_points():
+    """
+    Streamers of every shape the fits and the storages handle: histories longer than the fitting window,
+    with gaps, bursts and spending, a single day, a single reading, and no target.
+    """
+    twitch_points = TwitchPointsList()
+    for streamer in [make_streamer("long", 90, burst=4, gaps=range(20, 27), target=500000),
+                     make_streamer("spender", 60, rate=3000, spend_day=40, target=300000),
+                     make_streamer("irregular", 75, burst=1, rate=500, gaps=(3, 4, 5, 30, 50, 51), target=100000),
+                     make_streamer("single_day", 1, burst=5, target=10000),
+                     make_streamer("single_reading", 1, burst=1, target=5000),
+                     make_streamer("no_target", 45, burst=2)]:
+        twitch_points.add_entry(streamer)
+    return twitch_points
+
+
+@pytest.fixture
+def csv_file(tmp_path, twitch_points):
+    """
+    twitch_points saved as twitch_points.csv in a temporary directory.
+    """
+    filename = tmp_path / "twitch_points.csv"
+    twitch_points.save_to_file(filename)
+    return filename
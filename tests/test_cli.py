@@ -0,0 +1,111 @@
+import io
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from twitch_points_cli import MAX_POINTS, ingest, main, read_csv, read_jsonl
+from twitch_points_list import TwitchPointsList
+from twitch_points_series import to_timestamp
+
+NOW = datetime(2024, 6, 1, 12)
+
+
+def test_read_csv():
+    file = io.StringIO("name,points,date,target\n"
+                       "a,100\n"
+                       "\n"
+                       "b,200,2024-05-01 20:15:00,5000\n"
+                       f"a,{MAX_POINTS},,\n")
+    assert list(read_csv(file)) == [("a", 100, None, None),
+                                    ("b", 200, np.datetime64("2024-05-01T20:15:00", "us"), 5000),
+                                    ("a", MAX_POINTS, None, None)]
+
+
+@pytest.mark.parametrize("row, message", [
+    (f"a,{MAX_POINTS + 1}", "points"),
+    ("a,-1", "points"),
+    ("a,1.5", "points"),
+    ("a,lots", "points"),
+    ("a", "points"),
+    (",100", "name"),
+    ("a,100,yesterday", "date"),
+    ("a,100,99999-01-01", "date"),
+    ("a,100,2024-05-01T20:15:00+02:00", "timezone"),
+    (f"a,100,,{MAX_POINTS + 1}", "target"),
+    ("a,100,,-5", "target"),
+])
+def test_read_csv_rejects_bad_rows(row, message):
+    file = io.StringIO(f"a,100\nb,200\n{row}\nc,300\n")
+    with pytest.raises(ValueError, match=f"^Line 3: .*{message}"):
+        list(read_csv(file))
+
+
+def test_read_csv_skips_only_a_first_line_header():
+    with pytest.raises(ValueError, match="^Line 2: "):
+        list(read_csv(io.StringIO("a,100\nname,points\n")))
+
+
+def test_read_jsonl():
+    file = io.StringIO('{"name": "a", "points": 100}\n'
+                       '\n'
+                       '{"name": "b", "points": 200, "date": "2024-05-01 20:15:00", "target": 5000}\n')
+    assert list(read_jsonl(file)) == [("a", 100, None, None),
+                                      ("b", 200, np.datetime64("2024-05-01T20:15:00", "us"), 5000)]
+
+
+@pytest.mark.parametrize("line, message", [
+    (f'{{"name": "a", "points": {MAX_POINTS + 1}}}', "points"),
+    ('{"name": "a", "points": -1}', "points"),
+    ('{"name": "a", "points": 1.5}', "points"),
+    ('{"name": "a", "points": "100"}', "points"),
+    ('{"name": "a", "points": true}', "points"),
+    ('{"name": "a"}', "points"),
+    ('{"points": 100}', "name"),
+    ('{"name": "a", "points": 100, "date": 12345}', "date"),
+    ('{"name": "a", "points": 100, "date": "99999-01-01"}', "date"),
+    ('{"name": "a", "points": 100, "date": "2024-05-01T20:15:00+02:00"}', "timezone"),
+    ('{"name": "a", "points": 100, "target": 2.5}', "target"),
+    ('[1, 2]', "object"),
+    ('{"name": "a",', "Expecting"),
+])
+def test_read_jsonl_rejects_bad_lines(line, message):
+    file = io.StringIO(f'{{"name": "a", "points": 100}}\n\n{line}\n')
+    with pytest.raises(ValueError, match=f"^Line 3: .*{message}"):
+        list(read_jsonl(file))
+
+
+def test_ingest(twitch_points):
+    count = len(twitch_points.get_entry("long"))
+    date = np.datetime64("2024-05-01T20:15:00", "us")
+    readings = [("long", 900000, date, None), ("new", 50, None, 1000), ("long", MAX_POINTS, None, 600000),
+                ("new", 60, None, None)]
+    affected, readings_count = ingest(twitch_points, iter(readings), NOW)
+    assert readings_count == 4
+    assert [streamer.name for streamer in affected] == ["long", "new"]
+
+    long = twitch_points.get_entry("long")
+    assert len(long) == count + 2
+    assert long.points[-1] == MAX_POINTS
+    assert long.target == 600000
+    new = twitch_points.get_entry("new")
+    assert new.points.tolist() == [50, 60]
+    assert new.timestamps.tolist() == [to_timestamp(NOW)] * 2
+    assert new.target == 1000
+
+
+def test_ingest_stops_at_a_bad_reading():
+    twitch_points = TwitchPointsList()
+    readings = read_jsonl(io.StringIO('{"name": "a", "points": 100}\n{"name": "a", "points": 1e30}\n'))
+    with pytest.raises(ValueError, match="^Line 2: "):
+        ingest(twitch_points, readings, NOW)
+    assert twitch_points.get_entry("a") is None
+
+
+def test_main_reports_the_bad_line(tmp_path, csv_file, capsys):
+    readings = tmp_path / "readings.csv"
+    readings.write_text(f"long,100\nlong,{MAX_POINTS + 1}\n")
+    data = csv_file.read_bytes()
+    assert main([str(readings), "--data", str(csv_file), "--models", str(tmp_path / "models.dat")]) == 1
+    assert f"{readings}: Line 2: points" in capsys.readouterr().err
+    assert csv_file.read_bytes() == data
@@ -0,0 +1,36 @@
+import os
+import stat
+
+import pytest
+
+from twitch_points_files import atomic_write
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_atomic_write_keeps_permissions(tmp_path):
+    filename = tmp_path / "twitch_points.csv"
+    umask = os.umask(0o027)
+    try:
+        with atomic_write(filename) as file:
+            file.write("new")
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+    assert [path.name for path in tmp_path.iterdir()] == ["twitch_points.csv"]
+
+    os.chmod(filename, 0o604)
+    with atomic_write(filename) as file:
+        file.write("replaced")
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o604
+    assert filename.read_text() == "replaced"
+
+
+def test_atomic_write_leaves_the_old_file_on_error(tmp_path):
+    filename = tmp_path / "twitch_points.csv"
+    filename.write_text("old")
+    with pytest.raises(RuntimeError):
+        with atomic_write(filename) as file:
+            file.write("partial")
+            raise RuntimeError
+    assert filename.read_text() == "old"
+    assert [path.name for path in tmp_path.iterdir()] == ["twitch_points.csv"]
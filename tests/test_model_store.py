@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from twitch_points_model_store import OLD_MAGIC, ModelStore
+
+
+def put(store, name, version, write=True):
+    store.put(name, version / 10, version * 100.0, version, version + 1, version, write=write)
+
+
+def reopened(store):
+    return {name: ModelStore(store.filename).get(name)["version"] for name in ModelStore(store.filename).names()}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ModelStore(str(tmp_path / "models.dat"))
+    for version, name in enumerate(["first", "second", "é" * 100], 1):
+        put(store, name, version)
+    return store
+
+
+def test_round_trip(store):
+    assert reopened(store) == {"first": 1, "second": 2, "é" * 100: 3}
+    record = ModelStore(store.filename).get("second")
+    assert (record["coef"], record["intercept"], record["start"], record["end"]) == (0.2, 200.0, 2, 3)
+
+
+def test_known_names_are_written_in_place(store, monkeypatch):
+    def save():
+        raise AssertionError("rewrote the store")
+
+    monkeypatch.setattr(store, "save", save)
+    size = os.path.getsize(store.filename)
+    put(store, "second", 20, write=False)
+    store.remove("first", write=False)
+    store.flush()
+    assert os.path.getsize(store.filename) == size
+    assert reopened(store) == {"second": 20, "é" * 100: 3}
+
+
+def test_removed_slot_is_reused(store):
+    store.remove("second")
+    assert reopened(store) == {"first": 1, "é" * 100: 3}
+    size = os.path.getsize(store.filename)
+    put(store, "third", 4)
+    # The new name took the free slot, the rewrite replaced the name of the removed record with it
+    assert os.path.getsize(store.filename) == size - len("second") + len("third")
+    assert reopened(store) == {"first": 1, "third": 4, "é" * 100: 3}
+    store.remove("third")
+    store.remove("first")
+    put(store, "fourth", 5)
+    assert reopened(store) == {"fourth": 5, "é" * 100: 3}
+
+
+def test_old_format_is_dropped(tmp_path):
+    filename = tmp_path / "models.dat"
+    filename.write_bytes(OLD_MAGIC + bytes(100))
+    store = ModelStore(str(filename))
+    assert store.names() == []
+    put(store, "first", 1)
+    assert reopened(store) == {"first": 1}
+
+
+def test_other_files_are_rejected(tmp_path):
+    filename = tmp_path / "models.dat"
+    filename.write_bytes(b"not a model store")
+    with pytest.raises(ValueError):
+        ModelStore(str(filename)).names()
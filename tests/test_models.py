@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from conftest import make_streamer
+from twitch_points_list import TwitchPointsList
+from twitch_points_models import IncrementalLinearRegression, TwitchPointsModels
+from twitch_points_series import US_PER_SECOND, WINDOW_DAYS, PointsSeries
+from twitch_points_sqlite import SQLiteStorage
+from twitch_points_storage import Storage
+
+
+def sklearn_fit(series):
+    """
+    The fit TwitchPointsModels made with sklearn: last entry of each of the last 30 days, x in seconds.
+    """
+    linear_model = pytest.importorskip("sklearn.linear_model")
+    days = series.daily_indices[-WINDOW_DAYS:]
+    model = linear_model.LinearRegression()
+    model.fit((series.timestamps[days] / US_PER_SECOND).reshape(-1, 1), series.points[days])
+    return float(model.coef_[0]), float(model.intercept_)
+
+
+def assert_same_line(model, coef, intercept, series):
+    assert model.coef_ == pytest.approx(coef, rel=1e-9, abs=1e-12)
+    # The intercept is at x = 0, decades before the entries, compare the line where it is fitted
+    x = series.timestamps[[0, -1]] / US_PER_SECOND
+    np.testing.assert_allclose(model.predict(x), x * coef + intercept, rtol=1e-9)
+
+
+@pytest.fixture
+def streamers(twitch_points):
+    return twitch_points.streamers
+
+
+def test_incremental_updates_match_sklearn(streamers):
+    for streamer in streamers:
+        series = PointsSeries()
+        model = IncrementalLinearRegression()
+        model.fit(series)
+        for timestamp, points in zip(streamer.timestamps.tolist(), streamer.points.tolist()):
+            series.append(timestamp, points)
+            model.update(series)
+        assert model.n == min(len(series.daily_indices), WINDOW_DAYS)
+        assert_same_line(model, *sklearn_fit(series), series)
+
+
+def test_batch_fit_matches_sklearn(streamers):
+    models = TwitchPointsModels()
+    models.construct_models(streamers)
+    for streamer in streamers:
+        coef, intercept = sklearn_fit(streamer.series)
+        model = models.models[streamer]
+        assert model.coef_ == pytest.approx(coef, rel=1e-9, abs=1e-12)
+        x = streamer.timestamps[[0, -1]] / US_PER_SECOND
+        np.testing.assert_allclose(model.predict(x), x * coef + intercept, rtol=1e-9)
+
+
+def test_update_after_batch_fit_matches_refit(streamers):
+    streamer = streamers[0]
+    models = TwitchPointsModels()
+    models.construct_models([streamer])
+    streamer.add_entry(int(streamer.points[-1]) + 1000, int(streamer.timestamps[-1]) + 86_400 * US_PER_SECOND)
+    models.construct_model(streamer)
+    assert_same_line(models.models[streamer], *sklearn_fit(streamer.series), streamer.series)
+
+
+def test_out_of_order_entry_falls_back_to_refit():
+    series = PointsSeries()
+    for day, points in [(0, 100), (1, 200), (3, 400)]:
+        series.append(day * 86_400 * US_PER_SECOND, points)
+    model = IncrementalLinearRegression()
+    model.fit(series)
+    series.append(2 * 86_400 * US_PER_SECOND, 250)
+    model.update(series)
+    assert model.n == 4
+    assert_same_line(model, *sklearn_fit(series), series)
+
+
+def test_single_day_is_flat():
+    series = PointsSeries()
+    series.append(0, 100)
+    series.append(60 * US_PER_SECOND, 300)
+    model = IncrementalLinearRegression()
+    model.fit(series)
+    assert model.coef_ == 0.0
+    assert model.intercept_ == 300
+
+
+@pytest.mark.parametrize("tail", [False, True])
+@pytest.mark.parametrize("days", [WINDOW_DAYS, 2 * WINDOW_DAYS])
+def test_sqlite_daily_windows_match_the_series(tmp_path, twitch_points, tail, days):
+    SQLiteStorage(str(tmp_path / "twitch_points.db")).save_all(twitch_points)
+    storage = SQLiteStorage(str(tmp_path / "twitch_points.db"), tail)
+    loaded = TwitchPointsList()
+    storage.load(loaded)
+    expected = [Storage().daily_window(streamer, days) for streamer in twitch_points.streamers]
+    for (timestamps, points), (expected_timestamps, expected_points) in zip(
+            storage.daily_windows(loaded.streamers, days), expected):
+        np.testing.assert_array_equal(timestamps, expected_timestamps)
+        np.testing.assert_array_equal(points, expected_points)
+    storage.close()
+
+
+@pytest.mark.parametrize("last_points", [1001, 999], ids=["near-flat", "falling"])
+def test_unreachable_target_is_never(last_points):
+    # The date where the line meets the target is out of the range of datetime
+    streamer = make_streamer("flat", 30, burst=1, rate=0, target=10 ** 15)
+    streamer.add_entry(last_points, int(streamer.timestamps[-1]) + 86_400 * US_PER_SECOND)
+    models = TwitchPointsModels()
+    models.construct_model(streamer)
+    assert models.when_target(streamer) == datetime.max
+
+
+def test_when_target_matches_when_targets(streamers):
+    models = TwitchPointsModels()
+    models.construct_models(streamers)
+    assert [models.when_target(streamer) for streamer in streamers] == models.when_targets(streamers)
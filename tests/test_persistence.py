@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pytest
+
+from twitch_points_journal import file_checksum, journal_filename, read_journal
+from twitch_points_list import Streamer
+from twitch_points_profiles import Profile
+from twitch_points_series import US_PER_DAY
+from twitch_points_storage import CsvStorage
+
+
+def open_profile(directory, **storage_options):
+    storage = CsvStorage(str(directory / "twitch_points.csv"), str(directory / "twitch_points.bin"), **storage_options)
+    profile = Profile("test", storage, str(directory / "twitch_points.models.dat")).load()
+    profile.persistence.interval = 0
+    return profile
+
+
+def test_saving_survives_a_failing_model_store(tmp_path, csv_file, monkeypatch, capsys):
+    profile = open_profile(tmp_path)
+    store = profile.models.store
+    save = store.save
+    failures = []
+
+    def fail_once():
+        if not failures:
+            failures.append(True)
+            raise ValueError("store failed")
+        save()
+
+    monkeypatch.setattr(store, "save", fail_once)
+    streamer = profile.twitch_points_list.streamers[0]
+    streamer.edit(points=int(streamer.points[-1]) + 100)
+    profile.models.construct_model(streamer)
+    profile.persistence.mark_dirty(streamer)
+    # Retried interval seconds after the failure
+    deadline = time.monotonic() + 5
+    while (not failures or profile.persistence.dirty) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    profile.persistence.close()
+
+    assert "Saving failed: store failed" in capsys.readouterr().out
+    # The journal record was written once, the model record on the retry
+    filename = profile.storage.filename
+    records = read_journal(journal_filename(filename), file_checksum(filename))
+    assert len([record for record in records if record[1] == streamer.name]) == 1
+    assert store.get(streamer.name)["version"] == len(streamer)
+
+
+def state(profile):
+    """
+    :return: (name, timestamps, points, target) of every streamer with its whole history, in list order
+    """
+    return [(streamer.name, *map(np.ndarray.tolist, (series.timestamps, series.points)), streamer.target)
+            for streamer in profile.twitch_points_list.streamers
+            for series in [profile.storage.entries(streamer)]]
+
+
+def edit(profile):
+    """
+    Make every kind of edit the journal records, saving after each of them.
+    """
+    twitch_points_list, persistence = profile.twitch_points_list, profile.persistence
+    first, second, third = twitch_points_list.streamers[:3]
+    for day in range(1, 4):
+        for streamer in (first, second):
+            streamer.extend(streamer.timestamps[-1:] + day * US_PER_DAY, streamer.points[-1:] + 1000)
+            persistence.mark_dirty(streamer)
+    first.target = 123456
+    second.target = None
+    persistence.mark_dirty(first, second)
+    # Longer than the fixed-width names of earlier stores
+    twitch_points_list.rename_entry(second, "renamed_" + "é" * 60, profile.models.models)
+    persistence.mark_dirty(second)
+    twitch_points_list.remove_entry(third)
+    persistence.mark_dirty()
+    added = twitch_points_list.add_entry(Streamer.from_arrays("added", first.timestamps[-2:], [5, 6], 1000))
+    persistence.mark_dirty(added)
+
+
+@pytest.mark.parametrize("storage_options", [{}, {"compact_size": 0}, {"compact_size": 200},
+                                             {"compact_size": 200, "tail": True}],
+                         ids=["journal", "compact-every-save", "compact-on-size", "tail"])
+def test_reload_replays_the_edits(tmp_path, csv_file, storage_options):
+    snapshot = csv_file.read_bytes()
+    profile = open_profile(tmp_path, **storage_options)
+    edit(profile)
+    expected = state(profile)
+    profile.persistence.close()
+    # Without compaction only the journal is written to
+    assert (csv_file.read_bytes() == snapshot) == ("compact_size" not in storage_options)
+
+    reloaded = open_profile(tmp_path, **storage_options)
+    assert state(reloaded) == expected
+    reloaded.persistence.close()
@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip("matplotlib")
+
+from twitch_points_list import plot_cache  # noqa: E402
+from twitch_points_models import TwitchPointsModels  # noqa: E402
+from twitch_points_series import PointsSeries  # noqa: E402
+
+
+@pytest.mark.parametrize("empty", [False, True])
+def test_plot_renders(twitch_points, empty):
+    streamer = twitch_points.get_entry("long")
+    models = TwitchPointsModels()
+    models.construct_model(streamer)
+    plot_cache.clear()
+    image = streamer.get_plot(models.models[streamer], series=PointsSeries() if empty else None).getvalue()
+    assert image.startswith(b"\x89PNG")
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from twitch_points_series import US_PER_DAY, US_PER_SECOND, PointsSeries, group_rows
+
+
+def brute_force_index(timestamps):
+    """
+    Days with entries and the position of each day's last entry, the later position on equal timestamps.
+    """
+    last = {}
+    for position, timestamp in enumerate(timestamps.tolist()):
+        day = timestamp // US_PER_DAY
+        if day not in last or timestamp >= timestamps[last[day]]:
+            last[day] = position
+    days = sorted(last)
+    return days, [last[day] for day in days]
+
+
+def assert_index(series):
+    days, positions = brute_force_index(series.timestamps)
+    assert series.days.tolist() == days
+    assert series.daily_indices.tolist() == positions
+
+
+@pytest.fixture
+def shuffled():
+    # Bursts of readings over 40 days, mostly in order with late and duplicated entries mixed in
+    rng = np.random.default_rng(1)
+    timestamps = np.sort(rng.integers(0, 40 * US_PER_DAY, size=300))
+    late = rng.choice(len(timestamps), size=60, replace=False)
+    timestamps[late] = rng.integers(0, 40 * US_PER_DAY, size=60)
+    timestamps[::25] = timestamps[::25] // US_PER_DAY * US_PER_DAY
+    timestamps = np.concatenate((timestamps, timestamps[::17]))
+    return timestamps, np.arange(len(timestamps), dtype=np.int64)
+
+
+def test_appends_out_of_order(shuffled):
+    timestamps, points = shuffled
+    series = PointsSeries()
+    for position, (timestamp, point) in enumerate(zip(timestamps.tolist(), points.tolist())):
+        series.append(timestamp, point)
+        if position % 7 == 0:
+            assert_index(series)
+    assert_index(series)
+
+
+def test_extend_and_wrapped_arrays_out_of_order(shuffled):
+    timestamps, points = shuffled
+    assert_index(PointsSeries.from_arrays(timestamps, points))
+    series = PointsSeries()
+    for start in range(0, len(timestamps), 50):
+        series.extend(timestamps[start:start + 50], points[start:start + 50])
+        assert_index(series)
+
+
+def test_append_to_read_only_arrays():
+    timestamps = np.array([2 * US_PER_DAY, US_PER_DAY], dtype=np.int64)
+    timestamps.flags.writeable = False
+    series = PointsSeries.from_arrays(timestamps, np.array([20, 10], dtype=np.int64))
+    series.append(US_PER_DAY + 60 * US_PER_SECOND, 15)
+    assert_index(series)
+    assert series.daily_indices.tolist() == [2, 0]
+
+
+def test_group_rows_keeps_appearance_and_row_order():
+    groups = group_rows(["b", "a", "b", "c", "a", "b"])
+    assert [(name, rows.tolist()) for name, rows in groups] == [("b", [0, 2, 5]), ("a", [1, 4]), ("c", [3])]
+    assert group_rows([]) == []
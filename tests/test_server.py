@@ -0,0 +1,72 @@
+import json
+
+import numpy as np
+import pytest
+
+from twitch_points_cli import MAX_POINTS
+from twitch_points_profiles import Profile
+from twitch_points_server import IngestServer, RequestError, parse_readings
+from twitch_points_storage import CsvStorage
+
+RECEIVED = np.datetime64("2024-06-01T12:00:00", "us")
+
+
+def test_failing_batch_does_not_stop_ingestion(tmp_path, csv_file, capsys):
+    storage = CsvStorage(str(csv_file), str(tmp_path / "twitch_points.bin"))
+    profile = Profile("default", storage, str(tmp_path / "twitch_points.models.dat")).load()
+    broken = Profile("broken", None)
+    server = IngestServer()
+    server.readings.put(("broken", [("long", 1, RECEIVED, None)]))
+    server.readings.put(("default", [("long", "not points", RECEIVED, None)]))
+    assert server.apply_pending({"default": profile, "broken": broken}) == {}
+    output = capsys.readouterr().out
+    assert "Applying 1 readings of profile broken failed" in output
+    assert "Applying 1 readings of profile default failed" in output
+
+    server.readings.put(("default", [("long", 123456789, RECEIVED, None)]))
+    affected = server.apply_pending({"default": profile})
+    assert [streamer.name for streamer in affected["default"]] == ["long"]
+    assert profile.twitch_points_list.get_entry("long").points[-1] == 123456789
+    assert server.applied == 3
+    profile.persistence.close()
+
+
+def test_parse_readings():
+    body = json.dumps({"readings": [{"name": "a", "points": MAX_POINTS},
+                                    {"name": "b", "points": 0, "date": "2024-05-01 20:15:00", "target": 5000}]})
+    assert parse_readings(body.encode(), RECEIVED) == [
+        ("a", MAX_POINTS, RECEIVED, None),
+        ("b", 0, np.datetime64("2024-05-01T20:15:00", "us"), 5000)]
+
+
+@pytest.mark.parametrize("reading", [
+    {"name": "a", "points": MAX_POINTS + 1},
+    {"name": "a", "points": -1},
+    {"name": "a", "points": True},
+    {"name": "a", "points": 1.5},
+    {"name": "a", "points": "100"},
+    {"name": "a"},
+    {"name": "", "points": 100},
+    {"name": "a", "points": 100, "date": 12345},
+    {"name": "a", "points": 100, "date": "99999-01-01"},
+    {"name": "a", "points": 100, "date": "2024-05-01T20:15:00+02:00"},
+    {"name": "a", "points": 100, "date": "yesterday"},
+    {"name": "a", "points": 100, "target": MAX_POINTS + 1},
+    {"name": "a", "points": 100, "target": -1},
+    {"name": "a", "points": 100, "target": False},
+    {"name": "a", "points": 100, "target": 2.5},
+    "a",
+])
+def test_invalid_reading_is_rejected_before_it_is_queued(reading):
+    server = IngestServer()
+    body = json.dumps([{"name": "a", "points": 100}, reading]).encode()
+    with pytest.raises(RequestError, match="^Reading 1: ") as error:
+        server.route("POST", "/readings", body)
+    assert error.value.status == 400
+    assert server.readings.empty()
+    assert server.received == 0
+
+
+def test_failed_start_does_not_hang():
+    with pytest.raises(OverflowError):
+        IngestServer(port=70000).start_thread()
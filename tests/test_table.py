@@ -0,0 +1,204 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("tkinter")
+
+from gui.twitch_points_table import TwitchPointsTable, longest_increasing_subsequence, no_target_color  # noqa: E402
+from twitch_points_list import Streamer, TwitchPointsList  # noqa: E402
+from twitch_points_sort_index import SortIndex  # noqa: E402
+
+
+class FakeTreeview:
+    """
+    The part of ttk.Treeview the table uses, counting the widget operations.
+    """
+
+    def __init__(self):
+        self.children = []
+        self.values = {}
+        self.tags = {}
+        self.selected = ()
+        self.operations = {"insert": 0, "item": 0, "delete": 0, "move": 0}
+
+    def insert(self, parent, index, iid, values, tags):
+        self.operations["insert"] += 1
+        self.children.insert(len(self.children) if index == "end" else index, iid)
+        self.values[iid] = values
+        self.tags[iid] = tags
+
+    def item(self, iid, values=None, tags=None):
+        self.operations["item"] += 1
+        if values is not None:
+            self.values[iid] = values
+        if tags is not None:
+            self.tags[iid] = tags
+
+    def delete(self, *items):
+        for iid in items:
+            self.operations["delete"] += 1
+            self.children.remove(iid)
+            del self.values[iid]
+
+    def detach(self, iid):
+        self.children.remove(iid)
+
+    def move(self, iid, parent, index):
+        self.operations["move"] += 1
+        self.children.insert(index, iid)
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, iid):
+        self.selected = (iid,)
+
+    def yview_moveto(self, fraction):
+        pass
+
+
+class FakeScrollbar:
+    def set(self, first, last):
+        pass
+
+
+def make_table(twitch, virtual=False, height=20, overscan=10):
+    # The table without its Tk widgets
+    table = TwitchPointsTable.__new__(TwitchPointsTable)
+    table.twitch = twitch
+    table.sort_index = SortIndex(twitch.streamers)
+    table.current_sort_column = "percentage"
+    table.sort_ascending = False
+    table.virtual = virtual
+    table.height = height
+    table.overscan = overscan
+    table.offset = 0
+    table.selected = None
+    table.rows = {}
+    table.items = []
+    table.treeview = FakeTreeview()
+    table.scrollbar = FakeScrollbar()
+    table.refresh_table()
+    return table
+
+
+def displayed(table):
+    return [table.treeview.values[iid][1] for iid in table.treeview.children]
+
+
+def expected(twitch, key, reverse):
+    return [streamer.name for streamer in sorted(twitch.streamers, key=key, reverse=reverse)]
+
+
+@pytest.fixture
+def twitch():
+    twitch = TwitchPointsList()
+    for i in range(50):
+        twitch.add_entry(Streamer(f"streamer_{i:02d}", (i * 37) % 101 * 10, datetime(2024, 1, 1), 1000))
+    return twitch
+
+
+def test_initial_order(twitch):
+    table = make_table(twitch)
+    assert displayed(table) == expected(twitch, lambda streamer: streamer.percentage, True)
+    assert [table.treeview.values[iid][0] for iid in table.treeview.children] == list(range(1, 51))
+
+
+def test_edit_moves_one_row(twitch):
+    table = make_table(twitch)
+    streamer = twitch.streamers[10]
+    for operation in table.treeview.operations:
+        table.treeview.operations[operation] = 0
+
+    streamer.add_entry(2000, datetime(2024, 1, 2))
+    table.refresh_streamer(streamer)
+    table.refresh_table()
+
+    assert displayed(table) == expected(twitch, lambda streamer: streamer.percentage, True)
+    assert displayed(table)[0] == streamer.name
+    operations = table.treeview.operations
+    assert (operations["insert"], operations["delete"], operations["move"]) == (0, 0, 1)
+
+
+def test_unchanged_refresh_touches_nothing(twitch):
+    table = make_table(twitch)
+    for operation in table.treeview.operations:
+        table.treeview.operations[operation] = 0
+    table.refresh_table()
+    assert table.treeview.operations == {"insert": 0, "item": 0, "delete": 0, "move": 0}
+
+
+def test_sort_and_remove(twitch):
+    table = make_table(twitch)
+    table.current_sort_column = "name"
+    table.sort_ascending = True
+    table.refresh_table()
+    assert displayed(table) == sorted(streamer.name for streamer in twitch.streamers)
+
+    removed = twitch.streamers[3]
+    twitch.remove_entry(removed)
+    table.remove_streamer(removed)
+    table.refresh_table()
+    assert displayed(table) == sorted(streamer.name for streamer in twitch.streamers)
+    assert len(table.treeview.children) == len(table.rows) == 49
+
+
+def test_virtual_window(twitch):
+    table = make_table(twitch, virtual=True, height=5, overscan=2)
+    order = expected(twitch, lambda streamer: streamer.percentage, True)
+    assert displayed(table) == order[:7]
+    table.scroll_to(20)
+    assert displayed(table) == order[18:27]
+    assert [table.treeview.values[iid][0] for iid in table.treeview.children] == list(range(19, 28))
+
+
+def test_longest_increasing_subsequence():
+    sequence = [3, 0, 4, 1, 5, 2, 6]
+    indices = longest_increasing_subsequence(sequence)
+    values = [sequence[i] for i in sorted(indices)]
+    assert len(values) == 4
+    assert values == sorted(values)
+    assert longest_increasing_subsequence([]) == set()
+
+
+def test_deselection_clears_the_selected_streamer(twitch):
+    table = make_table(twitch)
+    table.treeview.selection_set(table.treeview.children[0])
+    table.on_select(None)
+    assert table.selected is not None
+    table.treeview.selected = ()
+    table.on_select(None)
+    assert table.selected is None
+
+
+def test_virtual_selection_survives_scrolling_out(twitch):
+    table = make_table(twitch, virtual=True, height=5, overscan=2)
+    table.treeview.selection_set(table.treeview.children[0])
+    table.on_select(None)
+    selected = table.selected
+    table.scroll_to(30)
+    table.treeview.selected = ()
+    table.on_select(None)
+    assert table.selected is selected
+    table.scroll_to(0)
+    assert table.treeview.selection() == (table.item_of(selected),)
+    table.treeview.selected = ()
+    table.on_select(None)
+    assert table.selected is None
+
+
+def test_streamer_without_target(twitch):
+    streamer = twitch.add_entry(Streamer("no_target", 500, datetime(2024, 1, 1)))
+    streamer.est_date = datetime.max
+    table = make_table(twitch)
+    values = table.treeview.values[table.item_of(streamer)]
+    assert values[3:] == ("N/A", "N/A", "N/A")
+    assert table.treeview.tags[table.item_of(streamer)] == (no_target_color,)
+    assert streamer.target_annotation() == "Target: N/A\nEst. date: N/A"
+
+
+def test_streamer_with_zero_target(twitch):
+    streamer = twitch.add_entry(Streamer("zero_target", 0, datetime(2024, 1, 1), 0))
+    table = make_table(twitch)
+    assert table.treeview.values[table.item_of(streamer)][3:5] == ("0", "N/A")
+    assert table.treeview.tags[table.item_of(streamer)] == (no_target_color,)
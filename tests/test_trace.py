@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+import twitch_points_trace
+from twitch_points_trace import Tracer, defer_interaction, interaction
+
+
+class FakeWindow:
+    def __init__(self):
+        self.repaints = 0
+
+    def update_idletasks(self):
+        self.repaints += 1
+
+
+class Handler:
+    def __init__(self):
+        self.window = FakeWindow()
+        self.finish = None
+
+    @interaction("click")
+    def click(self, defer=False, show_now=False):
+        if defer:
+            self.finish = defer_interaction()
+            if show_now:
+                self.finish()
+
+
+@pytest.fixture
+def tracer(tmp_path, monkeypatch):
+    tracer = Tracer(str(tmp_path / "trace.json"))
+    monkeypatch.setattr(twitch_points_trace, "tracer", tracer)
+    return tracer
+
+
+def test_interaction_ends_with_the_handler(tracer):
+    Handler().click()
+    assert tracer.interactions["click"].count == 1
+
+
+def test_deferred_interaction_ends_when_shown(tracer):
+    handler = Handler()
+    handler.click(defer=True)
+    assert "click" not in tracer.interactions
+    time.sleep(0.01)
+    handler.finish()
+    handler.finish()
+    histogram = tracer.interactions["click"]
+    assert histogram.count == 1
+    assert histogram.max >= 0.01
+    # The repaint after the handler and the one after the deferred work
+    assert handler.window.repaints == 2
+
+
+def test_deferred_work_shown_within_the_handler(tracer):
+    handler = Handler()
+    handler.click(defer=True, show_now=True)
+    assert tracer.interactions["click"].count == 1
+    handler.finish()
+    assert tracer.interactions["click"].count == 1
+
+
+def test_no_deferral_outside_of_interactions(tracer):
+    assert defer_interaction() is None
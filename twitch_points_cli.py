@@ -0,0 +1,276 @@
+"""
+Headless batch mode: import point readings and print or export the table without the GUI.
+Neither tkinter nor matplotlib is imported.
+
+    python twitch_points_cli.py readings.csv more.jsonl --table
+    some_script | python twitch_points_cli.py - --format jsonl --export table.csv
+
+Readings are csv rows "name, points[, date[, target]]" or json lines {"name": ..., "points": ...,
+"date": ..., "target": ...}, the date and the target are optional. Points and targets are integers between 0 and
+2**63 - 1, dates are iso format without a timezone. A missing date is the time of the import, a csv header on the
+first line is skipped. An invalid reading stops the import with its line number and nothing is saved. Readings are
+read in chunks, only the models of streamers that received readings are refitted, and the streamers and models are
+saved once at the end.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+
+import twitch_points_trace
+from twitch_points_list import Streamer, TwitchPointsList
+from twitch_points_models import TwitchPointsModels
+from twitch_points_persistence import PersistenceService
+from twitch_points_series import group_rows
+from twitch_points_sort_index import sort_keys
+from twitch_points_storage import open_storage
+
+CHUNK_SIZE = 65536
+COLUMNS = ["name", "points", "target", "percentage", "est_date"]
+MAX_POINTS = int(np.iinfo(np.int64).max)
+
+
+def parse_points(value, field="points"):
+    """
+    :param value: points or target of a reading
+    :param field: name of the value in the error message
+    :return: value
+    :raise ValueError: when value is not an integer between 0 and MAX_POINTS
+    """
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= MAX_POINTS:
+        raise ValueError(f"{field} {value!r} is not an integer between 0 and {MAX_POINTS}")
+    return value
+
+
+def parse_date(value):
+    """
+    :param value: date of a reading, an iso format string without a timezone
+    :return: value as np.datetime64
+    :raise ValueError: when value is not such a date
+    """
+    if not isinstance(value, str):
+        raise ValueError(f"date {value!r} is not a string")
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"date {value!r} is not an iso format date")
+    if date.tzinfo is not None:
+        raise ValueError(f"date {value!r} has a timezone")
+    return np.datetime64(date, "us")
+
+
+def parse_int(value, field):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{field} {value!r} is not an integer")
+
+
+def parse_reading(reading):
+    """
+    :param reading: dict with a name and points, and optionally a date and a target
+    :return: (name, points, date, target), date and target are None when missing
+    :raise ValueError: when the reading is invalid
+    """
+    if not isinstance(reading, dict):
+        raise ValueError("reading is not an object")
+    name, date, target = reading.get("name"), reading.get("date"), reading.get("target")
+    if not isinstance(name, str) or not name:
+        raise ValueError("reading has no name")
+    return (name, parse_points(reading.get("points")), None if date is None or date == "" else parse_date(date),
+            None if target is None else parse_points(target, "target"))
+
+
+def read_csv(file):
+    """
+    :return: iterator of (name, points, date, target), date and target are None when missing
+    :raise ValueError: at the first invalid row, with its line number
+    """
+    reader = csv.reader(file)
+    for row in reader:
+        if not row:
+            continue
+        if reader.line_num == 1 and (len(row) < 2 or not row[1].strip().lstrip("-").isdigit()):
+            # Header
+            continue
+        row += [""] * (4 - len(row))
+        try:
+            yield parse_reading({"name": row[0], "points": parse_int(row[1], "points"), "date": row[2],
+                                 "target": parse_int(row[3], "target") if row[3] else None})
+        except ValueError as e:
+            raise ValueError(f"Line {reader.line_num}: {e}")
+
+
+def read_jsonl(file):
+    """
+    :return: iterator of (name, points, date, target), date and target are None when missing
+    :raise ValueError: at the first invalid line, with its number
+    """
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield parse_reading(json.loads(line))
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}")
+
+
+def read_readings(filename, file_format=None):
+    """
+    :param filename: path of a csv or jsonl file, - for stdin
+    :param file_format: csv or jsonl, from the file extension when None
+    :return: iterator of (name, points, date, target)
+    """
+    if file_format is None:
+        file_format = "jsonl" if filename.endswith((".jsonl", ".json")) else "csv"
+    reader = read_jsonl if file_format == "jsonl" else read_csv
+    if filename == "-":
+        yield from reader(sys.stdin)
+        return
+    with open(filename, "r", newline="") as file:
+        yield from reader(file)
+
+
+def ingest(twitch_points, readings, now):
+    """
+    Add readings to a list, a chunk at a time.
+    :param twitch_points: TwitchPointsList
+    :param readings: iterator of (name, points, date, target), date and target may be None
+    :param now: date of readings without one
+    :return: (streamers that received readings in the order they first did, number of readings)
+    """
+    affected = {}
+    count = 0
+    now = np.datetime64(now, "us")
+    while True:
+        chunk = list(islice(readings, CHUNK_SIZE))
+        if not chunk:
+            return list(affected.values()), count
+        count += len(chunk)
+        names, points, dates, targets = zip(*chunk)
+        timestamps = np.array([now if date is None else date for date in dates],
+                              dtype="datetime64[us]").view(np.int64)
+        points = np.array(points, dtype=np.int64)
+
+        for name, rows in group_rows(names):
+            streamer = twitch_points.get_entry(name)
+            if streamer is None:
+                streamer = twitch_points.add_entry(Streamer.from_arrays(name, timestamps[rows], points[rows]))
+            else:
+                streamer.extend(timestamps[rows], points[rows])
+            # The last target given wins
+            given = [targets[row] for row in rows.tolist() if targets[row] is not None]
+            if given:
+                streamer.target = int(given[-1])
+            affected[id(streamer)] = streamer
+
+
+def table_rows(twitch_points, column="percentage", descending=True):
+    """
+    :return: list of dicts with the COLUMNS of every streamer, sorted like the GUI table
+    """
+    streamers = sorted(twitch_points.streamers, key=lambda streamer: sort_keys(streamer)[column], reverse=descending)
+    rows = []
+    for streamer in streamers:
+        est_date = streamer.est_date
+        rows.append({"name": streamer.name,
+                     "points": int(streamer.points[-1]),
+                     "target": streamer.target,
+                     "percentage": None if streamer.percentage is None else round(float(streamer.percentage), 2),
+                     "est_date": None if est_date is None or est_date == datetime.max else est_date.isoformat()})
+    return rows
+
+
+def print_table(rows, file=sys.stdout):
+    cells = [[("" if row[column] is None else str(row[column])) for column in COLUMNS] for row in rows]
+    widths = [max([len(column)] + [len(cell[i]) for cell in cells]) for i, column in enumerate(COLUMNS)]
+    print("  ".join(column.ljust(width) for column, width in zip(COLUMNS, widths)), file=file)
+    for cell in cells:
+        print("  ".join(value.ljust(width) for value, width in zip(cell, widths)), file=file)
+
+
+def export_table(rows, filename):
+    """
+    Write the table as json when filename ends with .json, csv otherwise.
+    """
+    with open(filename, "w", newline="") as file:
+        if filename.endswith(".json"):
+            json.dump(rows, file, indent=2)
+        else:
+            writer = csv.DictWriter(file, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="csv or jsonl files of readings, - for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="format of the inputs, by extension by default")
+    parser.add_argument("--data", default="twitch_points.csv", help="csv file of the streamers")
+    parser.add_argument("--database", default="twitch_points.db", help="SQLite database used instead when it exists")
+    parser.add_argument("--models", default="models.dat", help="model store")
+    parser.add_argument("--tail", action="store_true",
+                        help="load only the last 30 days of each streamer, the csv file is paged through a column "
+                             "store next to it")
+    parser.add_argument("--table", action="store_true", help="print the table")
+    parser.add_argument("--export", metavar="FILE", help="write the table to a csv or json file")
+    parser.add_argument("--sort", choices=COLUMNS, default="percentage", help="table column to sort by")
+    parser.add_argument("--ascending", action="store_true")
+    parser.add_argument("--trace", metavar="FILE", help="write timing histograms to FILE, see twitch_points_trace")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        twitch_points_trace.enable(args.trace)
+
+    store = os.path.splitext(args.data)[0] + ".bin" if args.tail else None
+    storage = open_storage(args.data, store, args.database, args.tail)
+    twitch_points = TwitchPointsList()
+    storage.load(twitch_points)
+    models = TwitchPointsModels(storage)
+    models.load_models(args.models)
+    persistence = PersistenceService(twitch_points, models, storage)
+
+    now = datetime.now()
+    affected = []
+    readings = 0
+    for filename in args.inputs:
+        try:
+            streamers, count = ingest(twitch_points, read_readings(filename, args.format), now)
+        except ValueError as e:
+            print(f"{filename}: {e}", file=sys.stderr)
+            persistence.close()
+            return 1
+        affected.extend(streamers)
+        readings += count
+
+    # Models of streamers without new readings are restored as they are, the others are refitted
+    stale = models.restore_models(twitch_points.streamers)
+    models.construct_models(stale)
+    for streamer, est_date in zip(twitch_points.streamers, models.when_targets(twitch_points.streamers)):
+        streamer.est_date = est_date
+
+    # One save of everything that changed
+    affected = list({id(streamer): streamer for streamer in affected}.values())
+    if affected:
+        persistence.mark_dirty(*affected)
+    if stale:
+        persistence.mark_models(*stale)
+    persistence.close()
+    print(f"Imported {readings} readings of {len(affected)} streamers, fitted {len(stale)} models", file=sys.stderr)
+
+    if args.table or args.export:
+        rows = table_rows(twitch_points, args.sort, not args.ascending)
+        if args.table:
+            print_table(rows)
+        if args.export:
+            export_table(rows, args.export)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
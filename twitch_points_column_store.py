@@ -0,0 +1,240 @@
+"""
+Columnar binary store of point histories, opened with np.memmap.
+
+Layout:
+- a header identifying the csv snapshot the store was converted from,
+- a directory with the name, offset, length and target of each streamer,
+- the UTF-8 names of the streamers back to back, padded to a multiple of 8 bytes,
+- one int64 timestamp column and one int64 points column holding the entries of all streamers back to back.
+
+A streamer's entries are the slice [offset, offset + length) of both columns, so they are read without copying.
+
+Convert between the formats with:
+
+    python twitch_points_column_store.py import twitch_points.csv twitch_points.bin
+    python twitch_points_column_store.py export twitch_points.bin twitch_points.csv
+"""
+import argparse
+import csv
+import os
+import sys
+from itertools import islice
+from os.path import isfile
+
+import numpy as np
+
+from twitch_points_files import atomic_write, text_encoding
+from twitch_points_journal import file_checksum
+from twitch_points_series import group_rows
+
+MAGIC = b"TPCOLS02"
+# Csv rows parsed at a time by build_store
+CHUNK_SIZE = 65536
+NO_TARGET = np.iinfo(np.int64).min
+
+HEADER_DTYPE = np.dtype([("magic", "S8"),
+                         # Size, modification time and checksum of the csv snapshot, empty when not converted from one
+                         ("source_size", "<i8"),
+                         ("source_mtime", "<i8"),
+                         ("source_checksum", "S24"),
+                         ("streamers", "<i8"),
+                         ("entries", "<i8"),
+                         ("names_size", "<i8")])
+
+# The name of a streamer is the slice [name_offset, name_offset + name_length) of the names
+DIRECTORY_DTYPE = np.dtype([("name_offset", "<i8"),
+                            ("name_length", "<i8"),
+                            ("offset", "<i8"),
+                            ("length", "<i8"),
+                            ("target", "<i8")])
+
+
+def source_stat(filename):
+    """
+    :return: (size, modification time in ns) of a file, used to tell whether a store is older than its csv file
+    """
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_store(filename, entries, source=None):
+    """
+    Write a store, replacing filename atomically.
+    :param filename: path of the store
+    :param entries: list of (name, timestamps, points, target)
+    :param source: (size, mtime, checksum) of the csv snapshot the entries were loaded from
+    """
+    header, directory, names = layout([(name, len(timestamps), target) for name, timestamps, _, target in entries],
+                                      source)
+    with atomic_write(filename, "wb") as file:
+        file.write(header.tobytes())
+        file.write(directory.tobytes())
+        file.write(names)
+        for column in (1, 2):
+            for entry in entries:
+                file.write(np.ascontiguousarray(entry[column], dtype="<i8").tobytes())
+
+
+def layout(streamers, source=None):
+    """
+    :param streamers: list of (name, number of entries, target)
+    :param source: (size, mtime, checksum) of the csv snapshot
+    :return: (header, directory, names), the names padded so that the columns are aligned
+    """
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    if source is not None:
+        header["source_size"], header["source_mtime"], header["source_checksum"] = source[0], source[1], \
+            source[2].encode("ascii")
+    directory = np.zeros(len(streamers), dtype=DIRECTORY_DTYPE)
+    lengths = np.array([length for _, length, _ in streamers], dtype=np.int64)
+    directory["length"] = lengths
+    directory["offset"] = np.cumsum(lengths) - lengths
+    encoded = [name.encode("utf-8") for name, _, _ in streamers]
+    name_lengths = np.array([len(name) for name in encoded], dtype=np.int64)
+    directory["name_length"] = name_lengths
+    directory["name_offset"] = np.cumsum(name_lengths) - name_lengths
+    directory["target"] = [NO_TARGET if target is None else target for _, _, target in streamers]
+    names = b"".join(encoded)
+    names += bytes(-len(names) % 8)
+    header["streamers"] = len(streamers)
+    header["entries"] = int(lengths.sum())
+    header["names_size"] = len(names)
+    return header, directory, names
+
+
+def read_chunks(filename, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+    """
+    Stream the non-empty rows of a csv file.
+    :param encoding: encoding of the csv file, see text_encoding
+    :return: iterator of (rows, groups), see group_rows
+    """
+    with open(filename, "r", newline="", encoding=encoding) as file:
+        reader = csv.reader(file)
+        while True:
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                return
+            rows = [row for row in chunk if row]
+            if rows:
+                yield rows, group_rows([row[0] for row in rows])
+
+
+def build_store(filename, source_filename, chunk_size=CHUNK_SIZE):
+    """
+    Convert a csv file to a store without holding its entries in memory.
+    The csv file is read twice, once to count the entries of each streamer and once to fill in the columns
+    of the mapped store, a chunk of rows at a time.
+    :param filename: path of the store, replaced atomically
+    :param source_filename: path of the csv file, rows are "name, points, date[, target]"
+    :return: checksum of the csv file
+    """
+    source = (*source_stat(source_filename), file_checksum(source_filename))
+    encoding = text_encoding(source_filename)
+    # Name -> [number of entries, target], in the order of first appearance
+    streamers = {}
+    for rows, groups in read_chunks(source_filename, chunk_size, encoding):
+        for name, positions in groups:
+            if name not in streamers:
+                row = rows[positions[0]]
+                streamers[name] = [0, int(float(row[3])) if len(row) > 3 and row[3] else None]
+            streamers[name][0] += len(positions)
+
+    header, directory, names = layout([(name, count, target) for name, (count, target) in streamers.items()], source)
+    size = int(header["entries"][0])
+    offset = HEADER_DTYPE.itemsize + directory.nbytes + len(names)
+    with atomic_write(filename, "w+b") as file:
+        file.write(header.tobytes())
+        file.write(directory.tobytes())
+        file.write(names)
+        file.truncate(offset + 2 * size * 8)
+        if size:
+            file.flush()
+            columns = np.memmap(file, dtype="<i8", mode="r+", offset=offset, shape=(2, size))
+            # Next free position of each streamer in the columns
+            cursors = dict(zip(streamers, directory["offset"].tolist()))
+            for rows, groups in read_chunks(source_filename, chunk_size, encoding):
+                timestamps = np.array([row[2] for row in rows], dtype="datetime64[us]").view(np.int64)
+                points = np.array([row[1] for row in rows]).astype(np.int64)
+                for name, chunk_rows in groups:
+                    start = cursors[name]
+                    columns[0, start:start + len(chunk_rows)] = timestamps[chunk_rows]
+                    columns[1, start:start + len(chunk_rows)] = points[chunk_rows]
+                    cursors[name] = start + len(chunk_rows)
+            columns.flush()
+            del columns
+    return source[2]
+
+
+def read_header(filename):
+    header = np.fromfile(filename, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header["magic"][0] != MAGIC:
+        raise ValueError(f"{filename} is not a column store")
+    return header[0]
+
+
+def read_store(filename):
+    """
+    Map a store into memory.
+    :param filename: path of the store
+    :return: list of (name, timestamps, points, target), the arrays are read-only slices of the mapped columns
+    """
+    header = read_header(filename)
+    count, size, names_size = int(header["streamers"]), int(header["entries"]), int(header["names_size"])
+    directory = np.fromfile(filename, dtype=DIRECTORY_DTYPE, count=count, offset=HEADER_DTYPE.itemsize)
+    offset = HEADER_DTYPE.itemsize + count * DIRECTORY_DTYPE.itemsize
+    with open(filename, "rb") as file:
+        file.seek(offset)
+        names = file.read(names_size)
+    offset += names_size
+    if size == 0:
+        timestamps = points = np.zeros(0, dtype=np.int64)
+    else:
+        timestamps = np.memmap(filename, dtype="<i8", mode="r", offset=offset, shape=(size,))
+        points = np.memmap(filename, dtype="<i8", mode="r", offset=offset + size * 8, shape=(size,))
+
+    entries = []
+    for name_offset, name_length, start, length, target in directory.tolist():
+        name = names[name_offset:name_offset + name_length].decode("utf-8")
+        entries.append((name, timestamps[start:start + length], points[start:start + length],
+                        None if target == NO_TARGET else target))
+    return entries
+
+
+def is_current(filename, source_filename):
+    """
+    Whether a store was converted from the current version of a csv file.
+    :return: the checksum of the csv snapshot if it is, otherwise None
+    """
+    if not isfile(filename) or not isfile(source_filename):
+        return None
+    try:
+        header = read_header(filename)
+    except ValueError:
+        return None
+    if (int(header["source_size"]), int(header["source_mtime"])) != source_stat(source_filename):
+        return None
+    return header["source_checksum"].decode("ascii")
+
+
+def main():
+    from twitch_points_list import TwitchPointsList
+
+    parser = argparse.ArgumentParser(description="Convert between twitch_points.csv and the column store.")
+    parser.add_argument("direction", choices=["import", "export"], help="import a csv file or export a store")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args()
+
+    twitch_points = TwitchPointsList()
+    if args.direction == "import":
+        twitch_points.load_from_file(args.source)
+        twitch_points.save_to_store(args.destination)
+    else:
+        twitch_points.load_from_store(args.source)
+        twitch_points.save_to_file(args.destination)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import codecs
+import locale
+import os
+import stat
+from contextlib import contextmanager
+
+# Files are written as UTF-8, earlier versions wrote them in the locale encoding, e.g. cp1252 on Windows
+ENCODING = "utf-8"
+# Attempts at a free temporary file name
+TEMPORARY_ATTEMPTS = 100
+
+
+def create_temporary(directory, name):
+    """
+    Create a temporary file next to a file. Unlike mkstemp, which makes it readable by the owner only,
+    it gets the permissions of a new file, 0o666 less the umask.
+    :return: (file descriptor, path)
+    """
+    # Read and write like mkstemp, build_store maps the file it writes
+    flags = os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    for _ in range(TEMPORARY_ATTEMPTS):
+        temporary = os.path.join(directory, f".{name}.{os.urandom(6).hex()}.tmp")
+        try:
+            return os.open(temporary, flags, 0o666), temporary
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No free temporary file name for {name} in {directory}")
+
+
+@contextmanager
+def atomic_write(filename, mode="w", newline="", encoding=ENCODING):
+    """
+    Open a temporary file next to filename, and replace filename with it once the block succeeds.
+    A crash or an exception leaves either the old file or the complete new one, never a partial write.
+    The new file keeps the permissions of the old one.
+    :param filename: path of the file to write
+    :param mode: "w" for text or "wb" for binary
+    :param newline: newline argument of text files
+    :param encoding: encoding of text files
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+    descriptor, temporary = create_temporary(directory, name)
+    try:
+        with os.fdopen(descriptor, mode, **({} if "b" in mode else {"newline": newline, "encoding": encoding})) as file:
+            try:
+                os.chmod(temporary, stat.S_IMODE(os.stat(filename).st_mode))
+            except FileNotFoundError:
+                # A new file, the kernel applied the umask
+                pass
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def decode_text(data):
+    """
+    Decode a file written by this program, as UTF-8 or in the locale encoding of files written before.
+    :param data: bytes of the file
+    :return: str
+    """
+    try:
+        return data.decode(ENCODING)
+    except UnicodeDecodeError:
+        return data.decode(locale.getpreferredencoding(False))
+
+
+def text_encoding(filename, block_size=1024 * 1024):
+    """
+    Encoding of a file written by this program, read a block at a time. See decode_text.
+    :return: "utf-8" or the locale encoding
+    """
+    decoder = codecs.getincrementaldecoder(ENCODING)()
+    with open(filename, "rb") as file:
+        try:
+            while block := file.read(block_size):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return locale.getpreferredencoding(False)
+    return ENCODING
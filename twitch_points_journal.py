@@ -0,0 +1,98 @@
+import csv
+import io
+import zlib
+from os.path import isfile
+
+JOURNAL_SUFFIX = ".journal"
+
+# Record types, the first field of every journal row
+SNAPSHOT = "snapshot"
+ENTRY = "entry"
+TARGET = "target"
+RENAME = "rename"
+DELETE = "delete"
+
+
+def journal_filename(filename):
+    return filename + JOURNAL_SUFFIX
+
+
+def checksum(data):
+    """
+    Identify a snapshot by its content.
+    :param data: bytes of the snapshot csv file
+    :return: "crc32:size" string
+    """
+    return format_checksum(zlib.crc32(data), len(data))
+
+
+def format_checksum(crc, size):
+    return f"{crc:08x}:{size}"
+
+
+def file_checksum(filename, block_size=1024 * 1024):
+    """
+    Checksum of a snapshot file, read a block at a time.
+    """
+    crc = size = 0
+    with open(filename, "rb") as file:
+        while block := file.read(block_size):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+    return format_checksum(crc, size)
+
+
+def snapshot_record(snapshot_checksum):
+    # First row of every journal, the journal only applies to the snapshot it was started on
+    return [SNAPSHOT, snapshot_checksum]
+
+
+def entry_records(name, timestamps, points):
+    """
+    :param timestamps: array of timestamps in microseconds
+    :param points: array of points
+    """
+    return [[ENTRY, name, point, timestamp] for timestamp, point in zip(timestamps.tolist(), points.tolist())]
+
+
+def target_record(name, target):
+    return [TARGET, name, "" if target is None else target]
+
+
+def rename_record(old_name, new_name):
+    return [RENAME, old_name, new_name]
+
+
+def delete_record(name):
+    return [DELETE, name]
+
+
+def format_records(records):
+    """
+    :param records: list of record rows
+    :return: csv text of the records
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(records)
+    return buffer.getvalue()
+
+
+def read_journal(filename, snapshot_checksum):
+    """
+    Read the records of a journal that was started on the given snapshot.
+    A journal of another snapshot was already compacted into it and is ignored,
+    as is a last row that a crash cut short.
+    :param filename: path of the journal
+    :param snapshot_checksum: checksum of the snapshot file
+    :return: list of records without the snapshot row, None when the journal does not apply
+    """
+    if not isfile(filename):
+        return None
+    with open(filename, "r", newline="", encoding="utf-8") as file:
+        text = file.read()
+    if not text.endswith("\n"):
+        text = text[:text.rfind("\n") + 1]
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows or rows[0] != snapshot_record(snapshot_checksum):
+        return None
+    return rows[1:]
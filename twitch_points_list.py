@@ -1,12 +1,22 @@
 import csv
 import io
+from itertools import repeat
 
 import numpy as np
-import pandas as pd
 from datetime import datetime
 
-from matplotlib import pyplot as plt
-from matplotlib import dates as mdates
+from twitch_points_column_store import build_store, is_current, read_store, source_stat, write_store
+from twitch_points_files import atomic_write, decode_text
+from twitch_points_journal import DELETE, ENTRY, RENAME, TARGET, checksum, journal_filename, read_journal
+from twitch_points_plot_cache import PlotCache
+from twitch_points_series import PointsSeries, US_PER_SECOND, WINDOW_DAYS, from_timestamp, group_rows, tail_start, \
+    to_timestamp
+from twitch_points_trace import span
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# Rendered plots shared by all streamers
+plot_cache = PlotCache()
 
 
 def evenly_spaced_list(a, b, num_elements):
@@ -14,63 +24,193 @@ def evenly_spaced_list(a, b, num_elements):
     return [a + i * step for i in range(num_elements)]
 
 
-def concatenate_dates(dates):
+def write_csv(file, entries):
     """
-    Concatenate dates that are on the same day.
-    :param dates: list of dates
-    :return: list of dates with the same date concatenated
+    Write streamer entries as csv rows "name, points, date", the first row of each streamer also holds the target.
+    :param file: text file opened with newline=''
+    :param entries: iterable of (name, timestamps, points, target)
     """
-    unique_dates = []
-    reversed_dates = dates[::-1]
-    for date in reversed_dates:
-        if date.date() not in [unique_date.date() for unique_date in unique_dates]:
-            unique_dates.append(date)
-    return unique_dates[::-1]
+    writer = csv.writer(file)
+    for name, timestamps, points, target in entries:
+        points = points.tolist()
+        dates = format_dates(timestamps)
+        writer.writerow([name, points[0], dates[0], target])
+        writer.writerows(zip(repeat(name), points[1:], dates[1:]))
 
 
-class TwitchPointsList:
-    streamers = []
+def format_dates(timestamps):
+    """
+    Format timestamps with DATE_FORMAT in one vectorized pass.
+    :param timestamps: int64 array of timestamps in microseconds
+    :return: list of strings
+    """
+    iso = np.datetime_as_string(np.asarray(timestamps, dtype=np.int64).view("datetime64[us]"), unit="us")
+    return [date.replace("T", " ") for date in iso.tolist()]
+
 
+class TwitchPointsList:
     def __init__(self):
-        pass
+        self.streamers = []
+        # Streamer name -> Streamer, kept in sync with the streamers list
+        self.index = {}
 
     def add_entry(self, streamer):
-        if streamer not in self.streamers:
+        """
+        Add a streamer, or append its entries to the streamer with the same name.
+        :param streamer: Streamer
+        :return: the Streamer stored in the list
+        """
+        existing = self.index.get(streamer.name)
+        if existing is None:
             self.streamers.append(streamer)
-        else:
-            # Add points and date to the streamer
-            self.streamers[self.streamers.index(streamer)].add_entry(streamer.points[-1], streamer.dates[-1])
+            self.index[streamer.name] = streamer
+            return streamer
+        # Add points and date to the streamer
+        existing.extend(streamer.timestamps, streamer.points)
+        return existing
 
     def remove_entry(self, streamer):
         self.streamers.remove(streamer)
+        del self.index[streamer.name]
 
+    @span("get_entry")
     def get_entry(self, name):
-        for streamer in self.streamers:
-            if streamer.name == name:
-                return streamer
-        return None
+        return self.index.get(name)
+
+    def rename_entry(self, streamer, new_name, *mappings):
+        """
+        Rename a streamer.
+        Streamers are hashed by name, so every dict keyed by the streamer has to be re-keyed with it.
+        :param streamer: Streamer to rename
+        :param new_name: new name
+        :param mappings: dicts keyed by Streamer, e.g. TwitchPointsModels.models
+        """
+        if new_name == streamer.name:
+            return
+        if new_name in self.index:
+            raise ValueError(f"Streamer {new_name} already exists")
+
+        values = [mapping.pop(streamer) if streamer in mapping else None for mapping in mappings]
+        del self.index[streamer.name]
+
+        streamer.name = new_name
+
+        self.index[new_name] = streamer
+        for mapping, value in zip(mappings, values):
+            if value is not None:
+                mapping[streamer] = value
 
     def __str__(self):
         return str(self.streamers)
 
+    @span("save_to_file")
     def save_to_file(self, filename):
-        with open(filename, 'w', newline='') as file:
-            writer = csv.writer(file)
-            for streamer in self.streamers:
-                writer.writerow([streamer.name, streamer.points[0], streamer.dates[0], streamer.target])
-                for i in range(1, len(streamer.points)):
-                    writer.writerow([streamer.name, streamer.points[i], streamer.dates[i]])
-
-    def load_from_file(self, filename):
-        with open(filename, 'r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                date = datetime.strptime(row[2], "%Y-%m-%d %H:%M:%S.%f")
-                if len(row) == 4:
-                    self.add_entry(Streamer(row[0], int(row[1]), date, int(row[3])))
-                else:
-                    self.add_entry(Streamer(row[0], int(row[1]), date))
+        """
+        Write all streamers to a csv file. The file is replaced atomically.
+        """
+        with atomic_write(filename) as file:
+            write_csv(file, ((streamer.name, streamer.timestamps, streamer.points, streamer.target)
+                             for streamer in self.streamers))
+
+    @span("load_from_file")
+    def load_from_file(self, filename, store=None):
+        """
+        Load streamers from a csv file in one vectorized pass, then replay the edits journaled since it was written.
+        Rows are "name, points, date[, target]", the target is read from the first row of each streamer.
+        :param filename: path to the csv file
+        :param store: path of a column store kept as a binary copy of the csv file. It is mapped instead of
+                      parsing the csv file when it is up to date, and rewritten otherwise.
+        """
+        snapshot_checksum = is_current(store, filename) if store else None
+        if snapshot_checksum is not None:
+            self.load_from_store(store)
+        else:
+            with open(filename, 'rb') as file:
+                data = file.read()
+            snapshot_checksum = checksum(data)
+            rows = [row for row in csv.reader(io.StringIO(decode_text(data), newline='')) if row]
+            if rows:
+                self.load_rows(rows)
+            if store:
+                self.save_to_store(store, (*source_stat(filename), snapshot_checksum))
+        self.replay_journal(journal_filename(filename), snapshot_checksum)
+
+    @span("load_tail")
+    def load_tail(self, filename, store, days=WINDOW_DAYS):
+        """
+        Load only the recent entries of each streamer, then replay the journal.
+        The csv file is converted to the column store first when the store is not up to date, without reading
+        all entries into memory. Each streamer keeps the entries of its last days in its series,
+        the older ones stay in the mapped store as its history.
+        :param filename: path to the csv file
+        :param store: path of the column store
+        :param days: number of days with entries to keep in memory
+        """
+        snapshot_checksum = is_current(store, filename)
+        if snapshot_checksum is None:
+            snapshot_checksum = build_store(store, filename)
+        for name, timestamps, points, target in read_store(store):
+            start = tail_start(timestamps, days)
+            streamer = self.add_entry(Streamer.from_arrays(name, timestamps[start:], points[start:], target))
+            if start:
+                streamer.history = (timestamps[:start], points[:start])
+        self.replay_journal(journal_filename(filename), snapshot_checksum)
+
+    def load_rows(self, rows):
+        """
+        :param rows: non-empty csv rows of the file
+        """
+
+        timestamps = np.array([row[2] for row in rows], dtype="datetime64[us]").view(np.int64)
+        points = np.array([row[1] for row in rows]).astype(np.int64)
+        targets = np.array([row[3] if len(row) > 3 and row[3] else "nan" for row in rows]).astype(float)
+
+        for name, positions in group_rows([row[0] for row in rows]):
+            target = targets[positions[0]]
+            self.add_entry(Streamer.from_arrays(name, timestamps[positions], points[positions],
+                                                None if np.isnan(target) else int(target)))
+
+    def load_from_store(self, filename):
+        """
+        Load streamers from a column store. Their series are zero-copy slices of the mapped file.
+        :param filename: path of the store
+        """
+        for name, timestamps, points, target in read_store(filename):
+            self.add_entry(Streamer.from_arrays(name, timestamps, points, target, copy=False))
+
+    def save_to_store(self, filename, source=None):
+        """
+        Write all streamers to a column store.
+        :param filename: path of the store
+        :param source: (size, mtime, checksum) of the csv file the streamers were loaded from
+        """
+        write_store(filename, [(streamer.name, streamer.timestamps, streamer.points, streamer.target)
+                               for streamer in self.streamers], source)
 
+    def replay_journal(self, filename, snapshot_checksum):
+        """
+        Apply the records of a journal written by PersistenceService.
+        :param filename: path of the journal
+        :param snapshot_checksum: checksum of the snapshot the streamers were loaded from
+        """
+        records = read_journal(filename, snapshot_checksum)
+        for record in records or ():
+            kind, name = record[0], record[1]
+            streamer = self.index.get(name)
+            if kind == ENTRY:
+                points, timestamp = int(record[2]), int(record[3])
+                if streamer is None:
+                    self.add_entry(Streamer(name, points, timestamp))
+                else:
+                    streamer.add_entry(points, timestamp)
+            elif kind == TARGET:
+                streamer.target = int(record[2]) if record[2] else None
+            elif kind == RENAME:
+                self.rename_entry(streamer, record[2])
+            elif kind == DELETE:
+                self.remove_entry(streamer)
+
+    @span("to_df")
     def to_df(self):
         """
         Convert the list of streamers to a Pandas DataFrame.
@@ -78,11 +218,12 @@ class TwitchPointsList:
         Returns:
         - pd.DataFrame: DataFrame containing streamer data.
         """
+        import pandas as pd
+
         data = []
         for streamer in self.streamers:
-            percentage = streamer.points[-1] / streamer.target * 100 if streamer.target is not None else None
-            data.append(
-                [streamer, streamer.name, streamer.points[-1], streamer.target, percentage, streamer.est_date])
+            data.append([streamer, streamer.name, streamer.points[-1], streamer.target, streamer.percentage,
+                         streamer.est_date])
 
         columns = ["streamer_object", "name", "points", "target", "percentage", "est_date"]
         df = pd.DataFrame(data, columns=columns)
@@ -91,25 +232,124 @@ class TwitchPointsList:
 
 
 class Streamer:
-    est_date = None
+    __slots__ = ("name", "series", "_target", "est_date", "history")
 
     def __init__(self, name, points, date, target=None):
         self.name = name
-        self.points = [points]
-        self.dates = [date]
+        self.series = PointsSeries()
+        self.series.append(to_timestamp(date), points)
         self.target = target
+        self.est_date = None
+        # (timestamps, points) of the entries before the series that were left on disk by
+        # TwitchPointsList.load_tail, None when the series holds every entry
+        self.history = None
+
+    @classmethod
+    def from_arrays(cls, name, timestamps, points, target=None, copy=True):
+        """
+        Create a streamer from whole arrays of entries.
+        :param name: streamer name
+        :param timestamps: array-like of timestamps in microseconds
+        :param points: array-like of points
+        :param target: points target
+        :param copy: whether to copy the entries, int64 arrays can be used as they are
+        :return: Streamer
+        """
+        streamer = cls.__new__(cls)
+        streamer.name = name
+        if copy:
+            streamer.series = PointsSeries(max(len(timestamps), 4))
+            streamer.series.extend(timestamps, points)
+        else:
+            streamer.series = PointsSeries.from_arrays(timestamps, points)
+        streamer.target = target
+        streamer.est_date = None
+        streamer.history = None
+        return streamer
+
+    @property
+    def target(self):
+        return self._target
+
+    @target.setter
+    def target(self, target):
+        self._target = target
+        plot_cache.invalidate(self.name)
+
+    @property
+    def points(self):
+        return self.series.points
+
+    @property
+    def percentage(self):
+        # None without a target, and for a target of 0 which is no fraction of anything
+        return self.points[-1] / self.target * 100 if self.target else None
+
+    @property
+    def timestamps(self):
+        return self.series.timestamps
+
+    @property
+    def dates(self):
+        return self.series.dates
+
+    @property
+    def last_date(self):
+        return from_timestamp(self.series.timestamps[-1])
+
+    def __len__(self):
+        return len(self.series)
 
     def add_entry(self, points, date):
-        self.points.append(points)
-        self.dates.append(date)
+        self.series.append(to_timestamp(date), points)
+        plot_cache.invalidate(self.name)
+
+    def extend(self, timestamps, points):
+        self.series.extend(timestamps, points)
+        plot_cache.invalidate(self.name)
 
     def edit(self, points=None, target=None):
         if points is not None:
-            self.add_entry(points, str(datetime.now()))
+            self.add_entry(points, datetime.now())
         if target is not None:
             self.target = target
 
-    def get_plot(self, model=None, height_px=450, background_color='#2b2b2b'):
+    def target_annotation(self):
+        formatted_date = self.est_date.strftime(
+            '%d-%m-%Y') if self.est_date and self.est_date != datetime.max else 'N/A'
+        target = format(self.target, ",").replace(",", " ") if self.target is not None else 'N/A'
+        return f'Target: {target}\nEst. date: {formatted_date}'
+
+    def plot_key(self, model=None, height_px=450, background_color='#2b2b2b', series=None):
+        """
+        Key of the streamer's plot in plot_cache, made of everything that is drawn.
+        """
+        coefficients = None
+        if model:
+            coefficients = (float(np.ravel(model.coef_)[0]), float(np.ravel(model.intercept_)[0]))
+        size = len(self.series if series is None else series)
+        return self.name, size, self.target, self.est_date, coefficients, height_px, background_color
+
+    @span("get_plot")
+    def get_plot(self, model=None, height_px=450, background_color='#2b2b2b', series=None):
+        """
+        Get the plot of the streamer's points as a PNG buffer.
+        Rendered plots are kept in plot_cache.
+        :param series: PointsSeries of the entries to draw, e.g. from Storage.entries, the series when None
+        """
+        key = self.plot_key(model, height_px, background_color, series)
+        image = plot_cache.get(key)
+        if image is None:
+            image = self.render_plot(model, height_px, background_color, series).getvalue()
+            plot_cache.put(key, image)
+        return io.BytesIO(image)
+
+    @span("render_plot")
+    def render_plot(self, model=None, height_px=450, background_color='#2b2b2b', series=None):
+        # matplotlib is slow to import, only plotting needs it
+        from matplotlib import pyplot as plt
+        from matplotlib import dates as mdates
+
         # Calculate the width based on the desired height and the aspect ratio (16:9)
         width_px = int(height_px * (16 / 9))
 
@@ -121,24 +361,30 @@ class Streamer:
 
         # Plotting
         fig, ax = plt.subplots(figsize=(width_in, height_in))
-        ax.plot(self.dates, self.points,
+        if series is None:
+            series = self.series
+        dates = series.dates
+        points = series.points
+        # Long histories are downsampled to about one point per pixel column
+        line, filled = series.plot_indices(width_px)
+        ax.plot(dates[line], points[line],
                 marker='o',
                 color='lightblue',
                 label='Points',
                 markerfacecolor=background_color,
                 markeredgewidth=1.3)  # Plot points
 
-        filled_points = [True if date in concatenate_dates(self.dates) else False for date in self.dates]
-        for i in range(len(self.dates)):
-            if filled_points[i]:
-                ax.plot(self.dates[i], self.points[i],
-                        marker='o',
-                        color='lightblue')
+        # Fill the last entry of each day
+        ax.plot(dates[filled], points[filled],
+                marker='o',
+                linestyle='',
+                color='lightblue')
 
-        if model and model.coef_ != 0:
-            x_values = np.array([date.timestamp() for date in self.dates]).reshape(-1, 1)
-            y_values = model.predict(x_values)
-            ax.plot(self.dates, y_values, linestyle='-', color='orange', label='Prediction')
+        if model and model.coef_ != 0 and len(line):
+            # The prediction is a straight line, its endpoints are enough
+            ends = line[[0, -1]]
+            y_values = model.predict((series.timestamps[ends] / US_PER_SECOND).reshape(-1, 1))
+            ax.plot(dates[ends], np.ravel(y_values), linestyle='-', color='orange', label='Prediction')
 
         # Format x-axis date labels
         date_fmt = mdates.DateFormatter('%m-%d')
@@ -148,19 +394,18 @@ class Streamer:
         ax.set_ylabel('Points', color='white')
         ax.set_title(f'Points Over Time - {self.name}', color='white')
 
-        num_ticks = 5
-        tick_positions = np.linspace(min(self.points), max(self.points), num_ticks)
-        ax.set_yticks(tick_positions)
-        ytick_labels = evenly_spaced_list(min(self.points), max(self.points), num_ticks)
-        ax.set_yticklabels([format(int(label), ",").replace(",", " ") for label in ytick_labels])
+        # An empty series, e.g. of a streamer the storage has not written yet, is drawn as empty axes
+        if len(points):
+            num_ticks = 5
+            tick_positions = np.linspace(points.min(), points.max(), num_ticks)
+            ax.set_yticks(tick_positions)
+            ytick_labels = evenly_spaced_list(points.min(), points.max(), num_ticks)
+            ax.set_yticklabels([format(int(label), ",").replace(",", " ") for label in ytick_labels])
 
         ax.legend()
 
         # Add text annotation for target
-        formatted_date = self.est_date.strftime(
-            '%d-%m-%Y') if self.est_date and self.est_date != datetime.max else 'N/A'
-        ax.text(0, 1.047, f'Target: {format(self.target, ",").replace(",", " ")}\n'
-                          f'Est. date: {formatted_date}',
+        ax.text(0, 1.047, self.target_annotation(),
                 horizontalalignment='left',
                 verticalalignment='center',
                 transform=ax.transAxes,
@@ -182,7 +427,8 @@ class Streamer:
         return buf
 
     def __str__(self):
-        return str(self.name) + " " + str(self.points) + " " + str([str(date) for date in self.dates]) \
+        return str(self.name) + " " + str(self.points.tolist()) + " " \
+               + str([str(from_timestamp(timestamp)) for timestamp in self.timestamps]) \
                + " " + str(self.target)
 
     def __eq__(self, other):
@@ -0,0 +1,153 @@
+from os.path import isfile
+
+import numpy as np
+
+from twitch_points_files import atomic_write
+
+MAGIC = b"TPMODEL2"
+# Earlier versions of the store are dropped, the models are refitted and saved again
+OLD_MAGIC = b"TPMODEL"
+
+HEADER_DTYPE = np.dtype([("records", "<i8"),
+                         ("names_size", "<i8")])
+
+# One fixed-width record per streamer, the name is a slice of the names section after the records.
+# A record with an empty name is a free slot.
+RECORD_DTYPE = np.dtype([("name_offset", "<i8"),
+                         ("name_length", "<i8"),
+                         ("coef", "<f8"),
+                         ("intercept", "<f8"),
+                         ("start", "<i8"),
+                         ("end", "<i8"),
+                         ("version", "<i8")])
+
+
+class ModelStore:
+    """
+    Binary file of model coefficients, one fixed-width record per streamer name.
+    Names of any length are kept in a section after the records.
+    The file is read on first access only. flush() rewrites the changed records of names already in the file
+    in place, new names rewrite the whole file with save(). With write=False changes stay in memory until flush().
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.records = None
+        # Name of each slot, None for free slots
+        self.slot_names = []
+        self.slots: dict = {}
+        self.free_slots = []
+        # Whether the slots or names in memory differ from the file, so records cannot be written in place
+        self.layout_changed = False
+        # Slots changed since the file was written
+        self.dirty_slots = set()
+
+    def _load(self):
+        if self.records is not None:
+            return
+        self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        if not isfile(self.filename):
+            return
+        with open(self.filename, "rb") as file:
+            magic = file.read(len(MAGIC))
+            if magic != MAGIC:
+                if not magic.startswith(OLD_MAGIC):
+                    raise ValueError(f"{self.filename} is not a model store")
+                self.layout_changed = True
+                return
+            header = np.fromfile(file, dtype=HEADER_DTYPE, count=1)[0]
+            self.records = np.fromfile(file, dtype=RECORD_DTYPE, count=int(header["records"]))
+            names = file.read(int(header["names_size"]))
+        for slot, (offset, length) in enumerate(zip(self.records["name_offset"].tolist(),
+                                                    self.records["name_length"].tolist())):
+            if length:
+                name = names[offset:offset + length].decode("utf-8")
+                self.slot_names.append(name)
+                self.slots[name] = slot
+            else:
+                self.slot_names.append(None)
+                self.free_slots.append(slot)
+
+    def flush(self):
+        """
+        Write the changed records, in place unless the layout changed.
+        """
+        if not self.dirty_slots:
+            return
+        if self.layout_changed or not isfile(self.filename):
+            self.save()
+            return
+        with open(self.filename, "r+b") as file:
+            for slot in sorted(self.dirty_slots):
+                file.seek(len(MAGIC) + HEADER_DTYPE.itemsize + slot * RECORD_DTYPE.itemsize)
+                file.write(self.records[slot:slot + 1].tobytes())
+        self.dirty_slots.clear()
+
+    def names(self):
+        self._load()
+        return list(self.slots)
+
+    def get(self, name):
+        """
+        :param name: streamer name
+        :return: record with coef, intercept, start, end and version fields, or None
+        """
+        self._load()
+        slot = self.slots.get(name)
+        return None if slot is None else self.records[slot]
+
+    def save(self):
+        """
+        Write every record to a new file that atomically replaces the old one.
+        """
+        self._load()
+        encoded = [b"" if name is None else name.encode("utf-8") for name in self.slot_names]
+        lengths = np.array([len(name) for name in encoded], dtype=np.int64)
+        self.records["name_length"] = lengths
+        self.records["name_offset"] = np.cumsum(lengths) - lengths
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["records"] = len(self.records)
+        header["names_size"] = int(lengths.sum())
+        with atomic_write(self.filename, "wb") as file:
+            file.write(MAGIC)
+            file.write(header.tobytes())
+            file.write(self.records.tobytes())
+            file.write(b"".join(encoded))
+        self.layout_changed = False
+        self.dirty_slots.clear()
+
+    def put(self, name, coef, intercept, start, end, version, write=True):
+        """
+        Set the record of a streamer, in place if it already has one.
+        :param write: whether to flush the store right away
+        """
+        self._load()
+        slot = self.slots.get(name)
+        if slot is None:
+            if self.free_slots:
+                slot = self.free_slots.pop()
+                self.slot_names[slot] = name
+            else:
+                slot = len(self.records)
+                self.records = np.append(self.records, np.zeros(1, dtype=RECORD_DTYPE))
+                self.slot_names.append(name)
+            self.slots[name] = slot
+            self.layout_changed = True
+        for field, value in (("coef", coef), ("intercept", intercept), ("start", start), ("end", end),
+                             ("version", version)):
+            self.records[field][slot] = value
+        self.dirty_slots.add(slot)
+        if write:
+            self.flush()
+
+    def remove(self, name, write=True):
+        self._load()
+        slot = self.slots.pop(name, None)
+        if slot is None:
+            return
+        self.records[slot] = np.zeros(1, dtype=RECORD_DTYPE)[0]
+        self.slot_names[slot] = None
+        self.free_slots.append(slot)
+        self.dirty_slots.add(slot)
+        if write:
+            self.flush()
@@ -1,49 +1,141 @@
 from collections import deque
+from fractions import Fraction
 
-import joblib
 import numpy as np
 
-from twitch_points_list import TwitchPointsList
-from sklearn.linear_model import LinearRegression
+from twitch_points_model_store import ModelStore
+from twitch_points_series import US_PER_DAY, US_PER_SECOND, WINDOW_DAYS, to_timestamp
+from twitch_points_storage import Storage
+from twitch_points_trace import span
 from datetime import datetime
 
+MODELS_FILE = "models.dat"
 
-def concatenate_data(dates, points):
-    # Combine dates and points into tuples for easy sorting
-    combined_data = list(zip(dates, points))
-    # Sort combined data by dates in descending order
-    combined_data.sort(reverse=True)
 
-    # Use a deque to store unique dates
-    unique_dates = deque(maxlen=30)
-    result_dates = []
-    result_points = []
+class IncrementalLinearRegression:
+    """
+    Least squares line over the last entry of each of the last WINDOW_DAYS days.
+    The window is summarised by n, sum(x), sum(y), sum(xy) and sum(x^2), so adding, replacing
+    or evicting an entry costs O(1). x is kept in integer microseconds and the sums are Python ints,
+    which keeps them exact no matter how many updates were applied.
+    Exposes coef_, intercept_ and predict() like a fitted sklearn LinearRegression, with x in seconds.
+    """
+    __slots__ = ("window", "count", "n", "sum_x", "sum_y", "sum_xy", "sum_xx", "coef_", "intercept_", "bounds")
 
-    for date, point in combined_data:
-        # Check if the date is not in the deque already
-        if date.date() not in unique_dates:
-            # Append the date and point to the result lists
-            result_dates.append(date)
-            result_points.append(point)
-            # Append the date to the deque
-            unique_dates.append(date.date())
+    @classmethod
+    def from_coefficients(cls, coef, intercept, count, bounds):
+        """
+        Create a model from coefficients fitted elsewhere, e.g. by TwitchPointsModels.construct_models.
+        The window is rebuilt from the series on the first update.
+        :param coef: slope in points per second
+        :param intercept: intercept
+        :param count: number of streamer entries the coefficients were fitted on
+        :param bounds: first and last timestamp of the window
+        """
+        model = cls()
+        model.window = None
+        model.count = count
+        model.coef_ = coef
+        model.intercept_ = intercept
+        model.bounds = bounds
+        return model
+
+    def __init__(self):
+        # (day, timestamp, points) of the last entry of each day in the window
+        self.window = deque()
+        # Number of streamer entries consumed so far
+        self.count = 0
+        self.n = 0
+        self.sum_x = 0
+        self.sum_y = 0
+        self.sum_xy = 0
+        self.sum_xx = 0
+        self.coef_ = 0.0
+        self.intercept_ = 0.0
+        self.bounds = (0, 0)
+
+    def fit(self, series, window=None):
+        """
+        Rebuild the window from the daily index of a series.
+        :param series: PointsSeries
+        :param window: (timestamps, points) of the last entry of each of the last WINDOW_DAYS days,
+                       e.g. from Storage.daily_window. Taken from the series when None.
+        """
+        self.__init__()
+        if window is None:
+            days = series.daily_indices[-WINDOW_DAYS:]
+            window = series.timestamps[days], series.points[days]
+        for timestamp, point in zip(window[0].tolist(), window[1].tolist()):
+            self._push(timestamp, point)
+        self.count = len(series)
+        self._solve()
+
+    def update(self, series):
+        """
+        Consume the entries of a series that were added since the last fit or update.
+        Entries older than the newest one in the window fall back to a refit.
+        :param series: PointsSeries
+        """
+        if self.window is None or len(series) < self.count:
+            self.fit(series)
+            return
+        timestamps = series.timestamps[self.count:].tolist()
+        points = series.points[self.count:].tolist()
+        for timestamp, point in zip(timestamps, points):
+            if self.window and timestamp < self.window[-1][1]:
+                self.fit(series)
+                return
+            self._push(timestamp, point)
+        self.count = len(series)
+        self._solve()
 
-        # Break the loop if we have already collected 30 unique dates
-        if len(unique_dates) == 30:
-            break
+    def _push(self, timestamp, point):
+        day = timestamp // US_PER_DAY
+        if self.window and self.window[-1][0] == day:
+            # A later entry on the same day replaces the previous one
+            self._remove(self.window.pop())
+        self.window.append((day, timestamp, point))
+        self._add(timestamp, point, 1)
+        if len(self.window) > WINDOW_DAYS:
+            self._remove(self.window.popleft())
 
-    # Reverse the lists to maintain the original order
-    result_dates.reverse()
-    result_points.reverse()
+    def _remove(self, entry):
+        _, timestamp, point = entry
+        self._add(timestamp, point, -1)
 
-    return result_dates, result_points
+    def _add(self, x, y, sign):
+        self.n += sign
+        self.sum_x += sign * x
+        self.sum_y += sign * y
+        self.sum_xy += sign * x * y
+        self.sum_xx += sign * x * x
+
+    def _solve(self):
+        if self.window:
+            self.bounds = (self.window[0][1], self.window[-1][1])
+        denominator = self.n * self.sum_xx - self.sum_x * self.sum_x
+        if denominator == 0:
+            # A single day, sklearn fits a flat line through the mean
+            self.coef_ = 0.0
+            self.intercept_ = self.sum_y / self.n if self.n else 0.0
+            return
+        self.coef_ = float(Fraction((self.n * self.sum_xy - self.sum_x * self.sum_y) * US_PER_SECOND, denominator))
+        self.intercept_ = float(Fraction(self.sum_y * self.sum_xx - self.sum_x * self.sum_xy, denominator))
+
+    def predict(self, X):
+        return np.ravel(X) * self.coef_ + self.intercept_
 
 
 class TwitchPointsModels:
-    def __init__(self):
-        self.twitch_points_list = TwitchPointsList()
+    def __init__(self, storage=None):
+        """
+        :param storage: Storage the fitting windows are queried from, the series in memory when None
+        """
         self.models: dict = {}
+        self.store = ModelStore(MODELS_FILE)
+        self.storage = storage if storage is not None else Storage()
 
+    @span("construct_model")
     def construct_model(self, streamer):
         """
         Construct a linear regression model for the given streamer.
@@ -54,37 +146,126 @@ class TwitchPointsModels:
         :param streamer:
         :return:
         """
-        dates, points = concatenate_data(streamer.dates, streamer.points)
+        model = self.models.get(streamer)
+        if isinstance(model, IncrementalLinearRegression):
+            model.update(streamer.series)
+        else:
+            model = IncrementalLinearRegression()
+            model.fit(streamer.series, self.storage.daily_window(streamer, WINDOW_DAYS))
 
-        timestamps = [date.timestamp() for date in dates]
-        X = np.array(timestamps).reshape(-1, 1)
-        y = np.array(points).reshape(-1, 1)
+        self.models[streamer] = model
 
-        model = LinearRegression()
-        model.fit(X, y)
+    @span("construct_models")
+    def construct_models(self, streamers):
+        """
+        Construct the models of many streamers at once.
+        The daily windows of all series are concatenated into one array with per-streamer segments,
+        and the slopes and intercepts are computed with segmented NumPy reductions.
+        :param streamers: list of streamers
+        """
+        if not streamers:
+            return
+        windows = self.storage.daily_windows(streamers, WINDOW_DAYS)
+        segments = np.repeat(np.arange(len(streamers)), [len(timestamps) for timestamps, _ in windows])
+        timestamps = np.concatenate([timestamps for timestamps, _ in windows])
+        points = np.concatenate([points for _, points in windows]).astype(float)
 
-        self.models[streamer] = model
+        # Center x on the newest entry of each segment to keep the sums well conditioned
+        n = np.bincount(segments, minlength=len(streamers))
+        origins = timestamps[np.cumsum(n) - 1]
+        starts = timestamps[np.cumsum(n) - n]
+        x = (timestamps - origins[segments]) / US_PER_SECOND
+        mean_x = np.bincount(segments, weights=x, minlength=len(streamers)) / n
+        mean_y = np.bincount(segments, weights=points, minlength=len(streamers)) / n
+        dx = x - mean_x[segments]
+        dy = points - mean_y[segments]
+        sxx = np.bincount(segments, weights=dx * dx, minlength=len(streamers))
+        sxy = np.bincount(segments, weights=dx * dy, minlength=len(streamers))
+
+        coefs = np.divide(sxy, sxx, out=np.zeros(len(streamers)), where=sxx > 0)
+        intercepts = mean_y - coefs * (mean_x + origins / US_PER_SECOND)
 
-    def remove_model(self, streamer):
+        for streamer, coef, intercept, start, end in zip(streamers, coefs.tolist(), intercepts.tolist(),
+                                                         starts.tolist(), origins.tolist()):
+            self.models[streamer] = IncrementalLinearRegression.from_coefficients(coef, intercept, len(streamer),
+                                                                                  (start, end))
+
+    def remove_model(self, streamer, save=True):
+        """
+        :param save: whether to remove the streamer's record from the store too
+        """
         self.models.pop(streamer)
+        if save:
+            self.store.remove(streamer.name)
+
+    def save_models(self, streamers=None):
+        """
+        Write model records to the store.
+        :param streamers: streamers whose records changed, all models when None.
+                          Saving all models also drops the records of streamers that no longer exist.
+        """
+        if streamers is None:
+            streamers = list(self.models)
+            names = {streamer.name for streamer in streamers}
+            for name in self.store.names():
+                if name not in names:
+                    self.store.remove(name)
+        for streamer in streamers:
+            model = self.models[streamer]
+            self.store.put(streamer.name, model.coef_, model.intercept_, *model.bounds, model.count)
 
-    def save_models(self):
-        joblib.dump(self.models, "models.pkl")
+    def load_models(self, filename=MODELS_FILE):
+        """
+        Open the model store. Records are only read once restore_models needs them.
+        """
+        self.store = ModelStore(filename)
 
-    def load_models(self):
-        self.models = joblib.load("models.pkl")
+    def restore_models(self, streamers):
+        """
+        Restore the models of streamers from the store without refitting.
+        :param streamers: list of streamers
+        :return: streamers without an up-to-date record, which still need a model
+        """
+        stale = []
+        for streamer in streamers:
+            record = self.store.get(streamer.name)
+            if record is None or record["version"] != len(streamer) or record["end"] != streamer.timestamps.max():
+                stale.append(streamer)
+                continue
+            self.models[streamer] = IncrementalLinearRegression.from_coefficients(
+                float(record["coef"]), float(record["intercept"]), len(streamer),
+                (int(record["start"]), int(record["end"])))
+        return stale
 
     def predict(self, streamer, date):
-        if len(streamer.dates) == 1:
+        if len(streamer) == 1:
             return datetime.max
         model = self.models[streamer]
-        return model.predict([[date.timestamp()]])
+        return model.predict([[to_timestamp(date) / US_PER_SECOND]])
 
+    @span("when_target")
     def when_target(self, streamer):
-        model = self.models[streamer]
-        if model.coef_ == 0:
-            return datetime.max
-        w = model.coef_
-        b = model.intercept_
-        target = streamer.target
-        return datetime.fromtimestamp(int((target - b) / w))
+        """
+        :return: estimated date, datetime.max where the target is never reached, see when_targets
+        """
+        return self.when_targets([streamer])[0]
+
+    @span("when_targets")
+    def when_targets(self, streamers):
+        """
+        Estimate the target dates of many streamers at once.
+        :param streamers: list of streamers
+        :return: list of estimated dates, datetime.max where the target is never reached
+        """
+        coefs = np.array([float(np.ravel(self.models[streamer].coef_)[0]) for streamer in streamers])
+        intercepts = np.array([float(np.ravel(self.models[streamer].intercept_)[0]) for streamer in streamers])
+        targets = np.array([np.nan if streamer.target is None else streamer.target for streamer in streamers],
+                           dtype=float)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            seconds = np.trunc((targets - intercepts) / coefs)
+        limits = to_timestamp(datetime.min) // US_PER_SECOND, to_timestamp(datetime.max) // US_PER_SECOND
+        valid = (coefs != 0) & np.isfinite(seconds) & (seconds >= limits[0]) & (seconds <= limits[1])
+
+        dates = np.where(valid, seconds, 0).astype(np.int64).astype("datetime64[s]").astype(object)
+        return [date if ok else datetime.max for date, ok in zip(dates.tolist(), valid.tolist())]
@@ -0,0 +1,188 @@
+import threading
+
+from twitch_points_journal import delete_record, entry_records, rename_record, target_record
+from twitch_points_trace import span
+
+
+class PersistenceService:
+    """
+    Write-behind saving of the streamers and the model store.
+    The GUI reports edited streamers with mark_dirty, which compares them with their last saved state
+    and turns the difference into journal records for the storage. A background thread waits interval seconds
+    after the first notification, so a burst of edits is written once. Storages that are cheap to write to,
+    like SQLite, get their records right away instead.
+
+    The service is the only writer of the model store while it runs, other threads reading the store
+    have to hold store_lock.
+    """
+
+    def __init__(self, twitch_points_list, models, storage, interval=2.0):
+        """
+        :param twitch_points_list: TwitchPointsList, as loaded from storage
+        :param models: TwitchPointsModels
+        :param storage: Storage the streamers were loaded from
+        :param interval: seconds to wait for more edits before writing
+        """
+        self.twitch_points_list = twitch_points_list
+        self.models = models
+        self.storage = storage
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.store_lock = threading.Lock()
+        # id(streamer) -> (streamer, name, number of entries, target) as of the last notification
+        self.saved = {}
+        # Streamer names in list order, and name -> (timestamps, points, target) snapshots of their entries.
+        # The arrays are views, entries are only ever appended to a series so they do not change.
+        self.entries = {}
+        for streamer in twitch_points_list.streamers:
+            self._snapshot(streamer)
+        self.order = [streamer.name for streamer in twitch_points_list.streamers]
+        # Journal records and model records (name -> record) not written yet
+        self.records = []
+        self.model_records = {}
+        self.dirty = False
+        self.closing = False
+        self.thread = threading.Thread(target=self.run, name="persistence", daemon=True)
+        self.thread.start()
+
+    def _snapshot(self, streamer):
+        self.saved[id(streamer)] = (streamer, streamer.name, len(streamer), streamer.target)
+        self.entries[streamer.name] = (streamer.timestamps, streamer.points, streamer.target)
+
+    @span("mark_dirty")
+    def mark_dirty(self, *streamers):
+        """
+        Schedule a save after streamers were added, edited or renamed.
+        Call it without streamers after a removal, streamers missing from the list are dropped from the storage
+        and the model store.
+        Must be called from the thread that edits the streamers, after the edit and after refitting the model.
+        """
+        streamers_list = self.twitch_points_list.streamers
+        with self.lock:
+            current = {id(streamer) for streamer in streamers_list}
+            for key, (_, name, _, _) in list(self.saved.items()):
+                if key not in current:
+                    del self.saved[key]
+                    del self.entries[name]
+                    self.records.append(delete_record(name))
+
+            for streamer in streamers:
+                saved = self.saved.get(id(streamer))
+                if saved is None:
+                    self.records.extend(entry_records(streamer.name, streamer.timestamps, streamer.points))
+                    self.records.append(target_record(streamer.name, streamer.target))
+                else:
+                    _, name, count, target = saved
+                    if name != streamer.name:
+                        self.records.append(rename_record(name, streamer.name))
+                        del self.entries[name]
+                    self.records.extend(entry_records(streamer.name, streamer.timestamps[count:],
+                                                      streamer.points[count:]))
+                    if target != streamer.target:
+                        self.records.append(target_record(streamer.name, streamer.target))
+                self._snapshot(streamer)
+            self.order = [streamer.name for streamer in streamers_list]
+            if self.storage.write_behind:
+                self._mark_models(streamers)
+                return
+            order, entries, records = self.order, self._entries(), self.records
+            self.records = []
+
+        try:
+            self.storage.write(order, entries, records)
+        except Exception:
+            with self.lock:
+                # Written with the next edit
+                self.records[:0] = records
+            raise
+        finally:
+            with self.lock:
+                self._mark_models(streamers)
+
+    def mark_models(self, *streamers):
+        """
+        Schedule a save of the model records of streamers whose entries did not change, e.g. after refitting.
+        """
+        with self.lock:
+            self.order = [streamer.name for streamer in self.twitch_points_list.streamers]
+            self._mark_models(streamers)
+
+    def _mark_models(self, streamers):
+        for streamer in streamers:
+            model = self.models.models.get(streamer)
+            if model is not None:
+                self.model_records[streamer.name] = (model.coef_, model.intercept_, *model.bounds, model.count)
+        self.dirty = True
+        self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.dirty and not self.closing:
+                    self.condition.wait()
+                if not self.dirty:
+                    return
+                # Coalesce the edits that follow the first one
+                if not self.closing:
+                    self.condition.wait(self.interval)
+                pending = self.take_pending()
+
+            # Files are written without holding lock, so edits are never blocked by the disk
+            try:
+                self.write(*pending)
+            except Exception as e:
+                # Any failure, not only of the disk, must keep the thread alive and the edits pending
+                print(f"Saving failed: {e}")
+                _, _, records, model_records = pending
+                with self.lock:
+                    # Keep everything for the next attempt, newer model records win
+                    self.records[:0] = records
+                    self.model_records = {**model_records, **self.model_records}
+                    self.dirty = True
+                    if self.closing:
+                        return
+                    self.condition.wait(self.interval)
+
+    def _entries(self):
+        return [(name, *self.entries[name]) for name in self.order]
+
+    def take_pending(self):
+        """
+        :return: (streamer names, snapshot entries, journal records, model records)
+        """
+        pending = self.order, self._entries(), self.records, self.model_records
+        self.records = []
+        self.model_records = {}
+        self.dirty = False
+        return pending
+
+    @span("save")
+    def write(self, order, entries, records, model_records):
+        if self.storage.write_behind:
+            self.storage.write(order, entries, records)
+            # Written, a retry after a failure of the model store must not append them to the journal again
+            records.clear()
+
+        names = set(order)
+        with self.store_lock:
+            store = self.models.store
+            for name in store.names():
+                if name not in names:
+                    store.remove(name, write=False)
+            for name, record in model_records.items():
+                if name in names:
+                    store.put(name, *record, write=False)
+            # In place unless streamers were added or renamed
+            store.flush()
+
+    def close(self):
+        """
+        Write pending edits, stop the background thread and close the storage.
+        """
+        with self.lock:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join()
+        self.storage.close()
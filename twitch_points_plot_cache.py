@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+
+
+class PlotCache:
+    """
+    Least recently used cache of rendered plot images.
+    Keys are tuples starting with the streamer name, values are encoded image bytes.
+    The oldest images are evicted once the total size exceeds max_bytes.
+    Profiles are loaded on other threads than the GUI, so every access holds a lock.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.images = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            if key in self.images:
+                self.size -= len(self.images.pop(key))
+            if len(image) > self.max_bytes:
+                return
+            self.images[key] = image
+            self.size += len(image)
+            while self.size > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, name):
+        """
+        Drop every image of a streamer.
+        :param name: streamer name
+        """
+        with self.lock:
+            for key in [key for key in self.images if key[0] == name]:
+                self.size -= len(self.images.pop(key))
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.size = 0
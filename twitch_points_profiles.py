@@ -0,0 +1,168 @@
+"""
+Profiles: one dataset per Twitch account.
+
+Every profile has its own storage, TwitchPointsList, models and model store, and its own PersistenceService,
+so profiles share no streamers. The default profile is twitch_points.csv (or twitch_points.db) with models.dat,
+every other profile is a csv file or an SQLite database in the profiles directory, with its column store and
+model store next to it:
+
+    profiles/second_account.csv
+    profiles/second_account.bin
+    profiles/second_account.models.dat
+
+ProfileManager loads the profiles on a thread pool, a loaded profile stays in memory until the program exits.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from twitch_points_list import TwitchPointsList
+from twitch_points_models import MODELS_FILE, TwitchPointsModels
+from twitch_points_persistence import PersistenceService
+from twitch_points_storage import CsvStorage
+from twitch_points_trace import span
+
+DEFAULT_PROFILE = "default"
+PROFILES_DIRECTORY = "profiles"
+
+
+class Profile:
+    def __init__(self, name, storage, models_file=MODELS_FILE):
+        """
+        :param name: profile name, shown in the GUI
+        :param storage: Storage of the profile's streamers
+        :param models_file: model store of the profile
+        """
+        self.name = name
+        self.storage = storage
+        self.models_file = models_file
+        self.twitch_points_list = TwitchPointsList()
+        self.models = TwitchPointsModels(storage)
+        # Saves the edits, started by load
+        self.persistence = None
+        # Whether the models were restored or fitted and the estimates filled in
+        self.fitted = False
+
+    @classmethod
+    def open(cls, filename, tail=False):
+        """
+        Profile of a data file in the profiles directory, named after the file.
+        :param filename: csv file or SQLite database (.db)
+        :param tail: whether to load only the recent entries of each streamer
+        """
+        base, extension = os.path.splitext(filename)
+        if extension == ".db":
+            from twitch_points_sqlite import SQLiteStorage
+            storage = SQLiteStorage(filename, tail)
+        else:
+            storage = CsvStorage(filename, base + ".bin", tail=tail)
+        return cls(os.path.basename(base), storage, base + ".models.dat")
+
+    @span("load_profile")
+    def load(self, fit=True):
+        """
+        Load the streamers, open the model store and start saving edits.
+        :param fit: whether to restore or fit the models too, otherwise fit has to be called before estimates are used
+        :return: the profile
+        """
+        self.storage.load(self.twitch_points_list)
+        self.models.load_models(self.models_file)
+        self.persistence = PersistenceService(self.twitch_points_list, self.models, self.storage)
+        if fit:
+            self.fit()
+        return self
+
+    def fit(self):
+        """
+        Restore the models from the model store, fit the ones without an up-to-date record
+        and fill in the estimated dates.
+        """
+        streamers = self.twitch_points_list.streamers
+        with self.persistence.store_lock:
+            stale = self.models.restore_models(streamers)
+        self.models.construct_models(stale)
+        if stale:
+            self.persistence.mark_models(*stale)
+        for streamer, est_date in zip(streamers, self.models.when_targets(streamers)):
+            streamer.est_date = est_date
+        self.fitted = True
+
+    def close(self):
+        """
+        Write pending edits and close the storage.
+        """
+        if self.persistence is not None:
+            self.persistence.close()
+            self.persistence = None
+
+
+class ProfileManager:
+    """
+    Profiles by name, loaded in parallel on a thread pool.
+    Loading is mostly parsing and fitting, NumPy releases the GIL for much of it.
+    """
+
+    def __init__(self, profiles, workers=None):
+        """
+        :param profiles: list of Profile, the first one is the default
+        :param workers: number of loading threads, one per profile up to the number of CPUs when None
+        """
+        self.profiles = {profile.name: profile for profile in profiles}
+        self.default = profiles[0].name
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(len(profiles), os.cpu_count() or 1),
+                                           thread_name_prefix="profile")
+        # Name -> Future of the loaded profile
+        self.futures = {}
+
+    @classmethod
+    def discover(cls, default, directory=PROFILES_DIRECTORY, tail=False):
+        """
+        :param default: Profile opened first
+        :param directory: directory of the other profiles, a database wins over a csv file of the same name
+        :param tail: whether to load only the recent entries of each streamer
+        :return: ProfileManager of the default profile and the profiles in directory
+        """
+        filenames = {}
+        if os.path.isdir(directory):
+            for filename in sorted(os.listdir(directory)):
+                base, extension = os.path.splitext(filename)
+                if extension == ".db" or (extension == ".csv" and base not in filenames):
+                    filenames[base] = os.path.join(directory, filename)
+        profiles = [default] + [Profile.open(filename, tail) for base, filename in filenames.items()
+                                if base != default.name]
+        return cls(profiles)
+
+    def load(self, name, fit=True):
+        """
+        Start loading a profile, unless it already is.
+        :return: Future of the loaded Profile
+        """
+        if name not in self.futures:
+            self.futures[name] = self.executor.submit(self.profiles[name].load, fit)
+        return self.futures[name]
+
+    def load_all(self, fit=True):
+        """
+        Start loading every profile that is not loading yet.
+        :return: list of Futures
+        """
+        return [self.load(name, fit) for name in self.profiles]
+
+    def loaded(self):
+        """
+        :return: names of the profiles that finished loading, in order
+        """
+        return [name for name, future in self.futures.items() if future.done() and future.exception() is None]
+
+    def pending(self):
+        """
+        :return: whether profiles are still loading
+        """
+        return any(not future.done() for future in self.futures.values())
+
+    def close(self):
+        """
+        Wait for profiles still loading, then close every loaded profile.
+        """
+        self.executor.shutdown(wait=True)
+        for name in self.loaded():
+            self.profiles[name].close()
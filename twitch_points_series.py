@@ -0,0 +1,265 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+US_PER_SECOND = 1_000_000
+US_PER_DAY = 86_400 * US_PER_SECOND
+
+# Days of entries the models are fitted on, and what tail mode keeps in memory
+WINDOW_DAYS = 30
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_timestamp(date):
+    """
+    Convert a date to an int64 epoch timestamp in microseconds.
+    Dates are naive wall-clock times, so the epoch is naive as well.
+    :param date: datetime, numpy datetime64 or an already converted timestamp
+    :return: timestamp in microseconds
+    """
+    if isinstance(date, datetime):
+        return (date - EPOCH) // timedelta(microseconds=1)
+    if isinstance(date, np.datetime64):
+        return int(date.astype("datetime64[us]").astype(np.int64))
+    return int(date)
+
+
+def from_timestamp(timestamp):
+    """
+    Convert an epoch timestamp in microseconds back to a datetime.
+    :param timestamp: timestamp in microseconds
+    :return: naive datetime
+    """
+    return EPOCH + timedelta(microseconds=int(timestamp))
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Keeps the first and last point, and from each of threshold - 2 buckets in between the point
+    forming the largest triangle with the previously kept point and the average of the next bucket.
+    :param x: sorted array of x values
+    :param y: array of y values
+    :param threshold: number of points to keep
+    :return: indices of the kept points
+    """
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = size - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else size
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        # Twice the triangle areas, the constant factor does not change the maximum
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+def tail_start(timestamps, days=WINDOW_DAYS):
+    """
+    Start of the shortest suffix of entries that holds every entry of the last days that have entries.
+    The daily window of the suffix is the same as the daily window of all entries.
+    :param timestamps: array of timestamps in microseconds, in entry order
+    :param days: number of days with entries to keep
+    :return: position of the first entry of the suffix
+    """
+    entry_days = timestamps // US_PER_DAY
+    unique_days = np.unique(entry_days)
+    if len(unique_days) <= days:
+        return 0
+    return int(np.argmax(entry_days >= unique_days[-days]))
+
+
+def group_rows(names):
+    """
+    Group rows by name, in the order the names first appear, keeping the order of the rows of each name.
+    :param names: sequence of the name of each row
+    :return: list of (name, int64 array of the positions of its rows)
+    """
+    if not len(names):
+        return []
+    unique_names, first_rows, inverse = np.unique(names, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(inverse, minlength=len(unique_names)))))
+    return [(str(unique_names[code]), order[bounds[code]:bounds[code + 1]])
+            for code in np.argsort(first_rows).tolist()]
+
+
+def grow(array, used, size):
+    """
+    Return array, or a copy with at least size elements when it is too small.
+    The capacity is doubled so that repeated growth is amortized O(1).
+    """
+    capacity = len(array)
+    if size <= capacity:
+        return array
+    while capacity < size:
+        capacity = max(capacity * 2, 4)
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+class PointsSeries:
+    """
+    Compact time series of points entries.
+    Timestamps and points are kept in two int64 arrays that grow by amortized doubling,
+    the public properties are zero-copy views of the filled part.
+    Filled entries are never modified, so a view taken earlier stays a valid snapshot of the entries it covers.
+
+    The series also maintains a daily index: the sorted calendar days that have entries,
+    and for each of them the position of the day's last entry.
+    """
+    __slots__ = ("_timestamps", "_points", "_size", "_days", "_day_last", "_day_count")
+
+    def __init__(self, capacity=4):
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._points = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+        self._days = np.empty(capacity, dtype=np.int64)
+        self._day_last = np.empty(capacity, dtype=np.int64)
+        self._day_count = 0
+
+    @classmethod
+    def from_arrays(cls, timestamps, points):
+        """
+        Wrap existing int64 arrays without copying them, e.g. slices of a memory-mapped file.
+        They may be read-only, the first append moves the entries to a new writable array.
+        :param timestamps: int64 array of timestamps in microseconds
+        :param points: int64 array of points, same length as timestamps
+        """
+        if len(timestamps) != len(points):
+            raise ValueError("timestamps and points must have the same length")
+        series = cls(0)
+        series._timestamps = timestamps
+        series._points = points
+        series._size = len(timestamps)
+        series._rebuild_index()
+        return series
+
+    def _reserve(self, size):
+        self._timestamps = grow(self._timestamps, self._size, size)
+        self._points = grow(self._points, self._size, size)
+
+    def append(self, timestamp, points):
+        self._reserve(self._size + 1)
+        self._timestamps[self._size] = timestamp
+        self._points[self._size] = points
+        self._size += 1
+        self._index_entry(self._size - 1)
+
+    def _index_entry(self, position):
+        """
+        Update the bucket of the day of the entry at position.
+        """
+        timestamp = self._timestamps[position]
+        day = timestamp // US_PER_DAY
+        count = self._day_count
+        if count and self._days[count - 1] >= day:
+            # Entries mostly arrive in order, so the day is usually the last one
+            bucket = count - 1 if self._days[count - 1] == day else int(np.searchsorted(self._days[:count], day))
+            if self._days[bucket] == day:
+                if timestamp >= self._timestamps[self._day_last[bucket]]:
+                    self._day_last[bucket] = position
+                return
+        else:
+            bucket = count
+
+        self._days = grow(self._days, count, count + 1)
+        self._day_last = grow(self._day_last, count, count + 1)
+        self._days[bucket + 1:count + 1] = self._days[bucket:count]
+        self._day_last[bucket + 1:count + 1] = self._day_last[bucket:count]
+        self._days[bucket] = day
+        self._day_last[bucket] = position
+        self._day_count = count + 1
+
+    def _rebuild_index(self):
+        timestamps = self.timestamps
+        order = np.argsort(timestamps, kind="stable")
+        days = timestamps[order] // US_PER_DAY
+        last_of_day = np.append(days[:-1] != days[1:], True) if len(days) else days.astype(bool)
+        self._days = days[last_of_day]
+        self._day_last = order[last_of_day]
+        self._day_count = len(self._days)
+
+    def extend(self, timestamps, points):
+        """
+        Append many entries at once.
+        :param timestamps: array-like of timestamps in microseconds
+        :param points: array-like of points, same length as timestamps
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        points = np.asarray(points, dtype=np.int64)
+        if len(timestamps) != len(points):
+            raise ValueError("timestamps and points must have the same length")
+        start = self._size
+        end = start + len(timestamps)
+        self._reserve(end)
+        self._timestamps[start:end] = timestamps
+        self._points[start:end] = points
+        self._size = end
+        if start == 0:
+            self._rebuild_index()
+        else:
+            for position in range(start, end):
+                self._index_entry(position)
+
+    @property
+    def timestamps(self):
+        return self._timestamps[:self._size]
+
+    @property
+    def points(self):
+        return self._points[:self._size]
+
+    @property
+    def dates(self):
+        return self.timestamps.view("datetime64[us]")
+
+    @property
+    def days(self):
+        """
+        Sorted days (timestamp // US_PER_DAY) that have entries.
+        """
+        return self._days[:self._day_count]
+
+    @property
+    def daily_indices(self):
+        """
+        Positions of the last entry of each day, in the order of days.
+        """
+        return self._day_last[:self._day_count]
+
+    def plot_indices(self, max_points):
+        """
+        Positions of the entries to draw, in time order, downsampled with LTTB to at most max_points.
+        :param max_points: number of points that can be drawn, e.g. the plot width in pixels
+        :return: (line positions, positions of the last entries of days)
+        """
+        timestamps = self.timestamps
+        if np.all(timestamps[:-1] <= timestamps[1:]):
+            line = np.arange(self._size)
+        else:
+            line = np.argsort(timestamps, kind="stable")
+        line = line[lttb(timestamps[line], self.points[line], max_points)]
+
+        daily = self.daily_indices
+        daily = daily[lttb(timestamps[daily], self.points[daily], max_points)]
+        return line, daily
+
+    def __len__(self):
+        return self._size
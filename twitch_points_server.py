@@ -0,0 +1,337 @@
+"""
+Local ingestion server: scrapers post batches of readings over HTTP, on localhost or a Unix socket.
+
+    POST /readings[?profile=NAME]
+    [{"name": "streamer", "points": 1234, "date": "2024-05-01 20:15:00", "target": 50000}, ...]
+
+The date and the target are optional, a reading without a date is dated when it is received. Points and targets
+are integers between 0 and 2**63 - 1, dates are iso format without a timezone. The body may also be
+an object {"readings": [...]}. Readings are validated as a whole and answered with 202 {"accepted": n} before
+they are applied, or 400 and nothing is accepted. GET /status returns the number of readings received
+and applied so far.
+
+Readings are applied in micro-batches: everything received since the last batch is added to the list at once,
+and every affected streamer is refitted and saved once per batch. Inside the GUI (main.py --serve PORT) the batches
+are applied on the Tk thread, which polls the queue the server fills, so the list is only touched by one thread.
+Run on its own, without the GUI:
+
+    python twitch_points_server.py --port 8765
+    python twitch_points_server.py --unix /tmp/twitch_points.sock
+
+benchmarks/ingest_load.py measures the sustained throughput.
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import twitch_points_trace
+from twitch_points_cli import ingest, parse_reading
+from twitch_points_trace import span
+
+DEFAULT_PORT = 8765
+# Seconds between micro-batches
+BATCH_INTERVAL = 0.1
+MAX_BODY_SIZE = 16 * 1024 * 1024
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large"}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_readings(body, received):
+    """
+    :param body: request body, a json list of readings or an object with a readings list
+    :param received: date of readings without one
+    :return: list of (name, points, date, target) like twitch_points_cli.read_readings
+    :raise RequestError: when a reading is invalid, see twitch_points_cli.parse_reading
+    """
+    try:
+        readings = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise RequestError(400, f"Invalid json: {e}")
+    if isinstance(readings, dict):
+        readings = readings.get("readings")
+    if not isinstance(readings, list):
+        raise RequestError(400, "Expected a list of readings")
+
+    parsed = []
+    for i, reading in enumerate(readings):
+        try:
+            name, points, date, target = parse_reading(reading)
+        except ValueError as e:
+            raise RequestError(400, f"Reading {i}: {e}")
+        parsed.append((name, points, received if date is None else date, target))
+    return parsed
+
+
+def drain(readings_queue):
+    """
+    Take everything queued without waiting.
+    :param readings_queue: queue of (profile name, readings) batches
+    :return: profile name -> readings, in the order they were received
+    """
+    batches = {}
+    while True:
+        try:
+            profile, readings = readings_queue.get_nowait()
+        except queue.Empty:
+            return batches
+        batches.setdefault(profile, []).extend(readings)
+
+
+@span("apply_readings")
+def apply_readings(profile, readings, now=None):
+    """
+    Add a micro-batch of readings to a profile, then refit and save every affected streamer once.
+    Must be called from the thread that edits the profile's streamers.
+    :param profile: loaded Profile
+    :param readings: list of (name, points, date, target)
+    :param now: date of readings without one, the time of the call when None
+    :return: affected streamers
+    """
+    affected, _ = ingest(profile.twitch_points_list, iter(readings), now or datetime.now())
+    if not affected:
+        return affected
+    # Saved first, storages that write right away are queried by the refit
+    profile.persistence.mark_dirty(*affected)
+    models = profile.models
+    for streamer in affected:
+        models.construct_model(streamer)
+    for streamer, est_date in zip(affected, models.when_targets(affected)):
+        streamer.est_date = est_date
+    profile.persistence.mark_models(*affected)
+    return affected
+
+
+class IngestServer:
+    """
+    Asyncio HTTP server queueing the readings it receives for whichever thread applies them.
+    Connections are kept alive, so a client can post batch after batch on one connection.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None, default_profile="default"):
+        """
+        :param host: address to listen on, localhost by default
+        :param port: TCP port, 0 picks a free one
+        :param unix_path: listen on this Unix socket instead of TCP
+        :param default_profile: profile of requests that do not name one
+        """
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.default_profile = default_profile
+        # (profile name, readings) batches in the order they were received
+        self.readings = queue.SimpleQueue()
+        self.received = 0
+        self.applied = 0
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        if self.unix_path:
+            self.server = await asyncio.start_unix_server(self.handle, self.unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+
+    def start_thread(self):
+        """
+        Serve on a background thread, e.g. next to the Tk main loop. Returns once the server listens.
+        :raise Exception: whatever stopped the server from listening, e.g. OSError or OverflowError on a bad port
+        """
+        error = []
+
+        async def serve():
+            try:
+                await self.start()
+            except Exception as e:
+                error.append(e)
+                return
+            finally:
+                # Never leave the caller waiting
+                self.started.set()
+            async with self.server:
+                await self.server.serve_forever()
+
+        def run():
+            try:
+                asyncio.run(serve())
+            except asyncio.CancelledError:
+                pass
+
+        self.thread = threading.Thread(target=run, name="ingest", daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if error:
+            raise error[0]
+
+    def stop(self):
+        if self.loop is not None and self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+        if self.thread is not None:
+            self.thread.join()
+        if self.unix_path and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {"error": "Request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length)
+                try:
+                    status, payload = self.route(method, target, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Malformed request or the client went away
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer, status, payload, keep_alive=True):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    def route(self, method, target, body):
+        """
+        :return: (status, json payload)
+        """
+        url = urlsplit(target)
+        if url.path == "/status":
+            return 200, {"received": self.received, "applied": self.applied}
+        if url.path != "/readings":
+            raise RequestError(404, f"No such path {url.path}")
+        if method != "POST":
+            raise RequestError(405, "Readings are posted")
+        profile = parse_qs(url.query).get("profile", [self.default_profile])[0]
+        readings = parse_readings(body, np.datetime64(datetime.now(), "us"))
+        if readings:
+            self.readings.put((profile, readings))
+            self.received += len(readings)
+        return 202, {"accepted": len(readings)}
+
+    def apply_pending(self, profiles):
+        """
+        Apply everything received since the last call, one micro-batch per profile.
+        :param profiles: profile name -> loaded Profile, readings of other profiles are dropped
+        :return: profile name -> affected streamers
+        """
+        affected = {}
+        for name, readings in drain(self.readings).items():
+            profile = profiles.get(name)
+            if profile is None:
+                print(f"Dropped {len(readings)} readings of profile {name}, it is not loaded")
+            else:
+                try:
+                    affected[name] = apply_readings(profile, readings)
+                except Exception as e:
+                    # The other profiles and the next batches are still applied
+                    print(f"Applying {len(readings)} readings of profile {name} failed: {e}")
+            self.applied += len(readings)
+        return affected
+
+
+async def serve_headless(server, profile, interval=BATCH_INTERVAL):
+    """
+    Serve until interrupted, applying the readings on a worker thread every interval seconds.
+    """
+    await server.start()
+    print(f"Listening on {server.unix_path or f'{server.host}:{server.port}'}", file=sys.stderr, flush=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows, KeyboardInterrupt stops the loop there
+            pass
+    profiles = {profile.name: profile}
+    async with server.server:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            # One worker thread at a time, so the list is only edited by one thread
+            await loop.run_in_executor(None, server.apply_pending, profiles)
+
+
+def main(argv=None):
+    from twitch_points_profiles import DEFAULT_PROFILE, Profile
+    from twitch_points_storage import open_storage
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port, 0 picks a free one")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--data", default="twitch_points.csv", help="csv file of the streamers")
+    parser.add_argument("--database", default="twitch_points.db", help="SQLite database used instead when it exists")
+    parser.add_argument("--models", default="models.dat", help="model store")
+    parser.add_argument("--tail", action="store_true", help="load only the last 30 days of each streamer")
+    parser.add_argument("--interval", type=float, default=BATCH_INTERVAL, help="seconds between micro-batches")
+    parser.add_argument("--trace", metavar="FILE", help="write timing histograms to FILE, see twitch_points_trace")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        twitch_points_trace.enable(args.trace)
+
+    store = os.path.splitext(args.data)[0] + ".bin" if args.tail else None
+    profile = Profile(DEFAULT_PROFILE, open_storage(args.data, store, args.database, args.tail), args.models)
+    profile.load()
+    server = IngestServer(args.host, args.port, args.unix, DEFAULT_PROFILE)
+    try:
+        asyncio.run(serve_headless(server, profile, args.interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.apply_pending({profile.name: profile})
+        profile.close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+    print(f"Applied {server.applied} readings", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+
+
+def sort_keys(streamer):
+    """
+    Get the sort keys of a streamer for every table column.
+    Missing targets and percentages sort before every value.
+
+    Args:
+    - streamer (Streamer): The streamer.
+
+    Returns:
+    - dict: The sort key of each column.
+    """
+    percentage = streamer.percentage
+    return {"name": streamer.name,
+            "points": int(streamer.points[-1]),
+            "target": (streamer.target is not None, streamer.target or 0),
+            "percentage": (percentage is not None, percentage or 0),
+            "est_date": streamer.est_date or datetime.max}
+
+
+class SortIndex:
+    """
+    Sorted orders of streamers for every table column, maintained with bisection on each edit.
+    Each order is a sorted list of (key, sequence) pairs, the sequence number identifies the streamer
+    and keeps equal keys in insertion order.
+    """
+
+    def __init__(self, streamers=()):
+        self.orders = {"name": [], "points": [], "target": [], "percentage": [], "est_date": []}
+        self.keys = {}  # sequence -> sort keys of the streamer
+        self.streamers = {}  # sequence -> streamer
+        self.sequences = {}  # id(streamer) -> sequence
+        self.next_sequence = 0
+        for streamer in streamers:
+            self.update(streamer)
+
+    def __len__(self):
+        return len(self.streamers)
+
+    def __contains__(self, streamer):
+        sequence = self.sequences.get(id(streamer))
+        return sequence is not None and self.streamers[sequence] is streamer
+
+    def update(self, streamer):
+        """
+        Add a streamer, or move it to its new position in every order whose key changed.
+        """
+        if streamer not in self:
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            self.sequences[id(streamer)] = sequence
+            self.streamers[sequence] = streamer
+            old_keys = None
+        else:
+            sequence = self.sequences[id(streamer)]
+            old_keys = self.keys[sequence]
+
+        keys = sort_keys(streamer)
+        for column, order in self.orders.items():
+            if old_keys is not None:
+                if old_keys[column] == keys[column]:
+                    continue
+                del order[bisect_left(order, (old_keys[column], sequence))]
+            insort(order, (keys[column], sequence))
+        self.keys[sequence] = keys
+
+    def remove(self, streamer):
+        if streamer not in self:
+            return
+        sequence = self.sequences.pop(id(streamer))
+        keys = self.keys.pop(sequence)
+        for column, order in self.orders.items():
+            del order[bisect_left(order, (keys[column], sequence))]
+        del self.streamers[sequence]
+
+    def sync(self, streamers):
+        """
+        Match the index to a list of streamers, updating all of them.
+        """
+        current = {id(streamer) for streamer in streamers}
+        for streamer in list(self.streamers.values()):
+            if id(streamer) not in current:
+                self.remove(streamer)
+        for streamer in streamers:
+            self.update(streamer)
+
+    def ordered(self, column, ascending=True):
+        """
+        Iterate over the streamers sorted by a column.
+
+        Args:
+        - column (str): The column name.
+        - ascending (bool): Whether to iterate in ascending order, descending iterates the order reversed.
+
+        Returns:
+        - iterator: The streamers.
+        """
+        order = self.orders[column] if ascending else reversed(self.orders[column])
+        return (self.streamers[sequence] for _, sequence in order)
+
+    def window(self, column, ascending=True, start=0, stop=None):
+        """
+        Get a slice of a sorted order.
+
+        Args:
+        - column (str): The column name.
+        - ascending (bool): Whether the order is ascending.
+        - start (int): The first position.
+        - stop (int): The position after the last one, the end of the order when None.
+
+        Returns:
+        - list: The (sequence, streamer) pairs at positions start to stop.
+        """
+        order = self.orders[column]
+        size = len(order)
+        stop = size if stop is None else min(stop, size)
+        pairs = order[start:stop] if ascending else order[size - stop:size - start][::-1]
+        return [(sequence, self.streamers[sequence]) for _, sequence in pairs]
+
+    def position(self, streamer, column, ascending=True):
+        """
+        Get the position of a streamer in a sorted order.
+        """
+        sequence = self.sequences[id(streamer)]
+        index = bisect_left(self.orders[column], (self.keys[sequence][column], sequence))
+        return index if ascending else len(self.orders[column]) - 1 - index
@@ -0,0 +1,257 @@
+"""
+SQLite storage of the streamers.
+
+Entries live in one table indexed on (streamer, timestamp), so the entries of a streamer between two dates
+and the last entry of a day are index range scans. Edits are written in one transaction per notification,
+the database runs in WAL mode so the writes do not block readers.
+
+Convert from and to twitch_points.csv with:
+
+    python twitch_points_sqlite.py import twitch_points.csv twitch_points.db
+    python twitch_points_sqlite.py export twitch_points.db twitch_points.csv
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+from itertools import groupby
+
+import numpy as np
+
+from twitch_points_journal import DELETE, ENTRY, RENAME, TARGET
+from twitch_points_list import Streamer
+from twitch_points_series import US_PER_DAY, WINDOW_DAYS, PointsSeries, tail_start
+from twitch_points_storage import Storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS streamers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    target INTEGER
+);
+CREATE TABLE IF NOT EXISTS entries (
+    streamer INTEGER NOT NULL REFERENCES streamers (id),
+    timestamp INTEGER NOT NULL,
+    points INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_streamer_timestamp ON entries (streamer, timestamp);
+"""
+# Rows fetched at a time by a tail mode load
+CHUNK_SIZE = 65536
+# Last entry of each of the last days of the named streamers, walking back one day at a time with an index lookup
+# of the last entry before the day. Parameters are the names as a JSON array, US_PER_DAY and the number of days.
+DAILY_WINDOWS = """
+WITH RECURSIVE window (streamer, timestamp, points, day) AS (
+    SELECT id, timestamp, points, 1
+    FROM streamers JOIN entries ON entries.rowid = (SELECT rowid FROM entries WHERE streamer = id
+                                                    ORDER BY timestamp DESC LIMIT 1)
+    WHERE name IN (SELECT value FROM json_each(?1))
+    UNION ALL
+    SELECT entries.streamer, entries.timestamp, entries.points, day + 1
+    FROM window JOIN entries ON entries.rowid = (SELECT rowid FROM entries
+                                                 WHERE streamer = window.streamer
+                                                 AND timestamp < window.timestamp / ?2 * ?2
+                                                 ORDER BY timestamp DESC LIMIT 1)
+    WHERE day < ?3)
+SELECT name, timestamp, points FROM window JOIN streamers ON streamers.id = streamer ORDER BY streamer, timestamp
+"""
+
+
+class SQLiteStorage(Storage):
+    """
+    Streamers in an SQLite database. Streamers are listed in the order they were added,
+    entries are timestamps in microseconds like in PointsSeries.
+    Writes are cheap in WAL mode, so they are made when the edit is reported rather than written behind.
+    Every thread gets its own connection.
+
+    In tail mode only the last WINDOW_DAYS days of each streamer are loaded, range queries always read the database.
+    """
+    write_behind = False
+
+    def __init__(self, filename, tail=False):
+        """
+        :param filename: path of the database, created when it does not exist
+        :param tail: whether to load only the recent entries of each streamer
+        """
+        self.filename = filename
+        self.tail = tail
+        self.local = threading.local()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode a commit is durable after the next checkpoint, and the database is never corrupted
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def load(self, twitch_points_list):
+        if self.tail:
+            self.load_tail(twitch_points_list)
+            return
+        connection = self.connection()
+        streamers = connection.execute("SELECT id, name, target FROM streamers ORDER BY id").fetchall()
+        rows = np.array(connection.execute("SELECT streamer, timestamp, points FROM entries "
+                                           "ORDER BY streamer, timestamp").fetchall(), dtype=np.int64)
+        rows = rows.reshape(-1, 3)
+        ids = np.array([streamer_id for streamer_id, _, _ in streamers], dtype=np.int64)
+        starts = np.searchsorted(rows[:, 0], ids, side="left")
+        ends = np.searchsorted(rows[:, 0], ids, side="right")
+        for (_, name, target), start, end in zip(streamers, starts.tolist(), ends.tolist()):
+            if start == end:
+                continue
+            twitch_points_list.add_entry(Streamer.from_arrays(name, rows[start:end, 1], rows[start:end, 2], target))
+
+    def load_tail(self, twitch_points_list, days=WINDOW_DAYS):
+        """
+        Stream the entries in index order and keep the entries of the last days of each streamer.
+        """
+        connection = self.connection()
+        streamers = connection.execute("SELECT id, name, target FROM streamers ORDER BY id").fetchall()
+        cursor = connection.execute("SELECT streamer, timestamp, points FROM entries ORDER BY streamer, timestamp")
+        # Streamer id -> (timestamps, points) of its recent entries so far
+        tails = {}
+        while rows := cursor.fetchmany(CHUNK_SIZE):
+            rows = np.array(rows, dtype=np.int64)
+            ids, starts = np.unique(rows[:, 0], return_index=True)
+            ends = np.append(starts[1:], len(rows))
+            for streamer_id, start, end in zip(ids.tolist(), starts.tolist(), ends.tolist()):
+                timestamps, points = rows[start:end, 1], rows[start:end, 2]
+                if streamer_id in tails:
+                    timestamps = np.concatenate((tails[streamer_id][0], timestamps))
+                    points = np.concatenate((tails[streamer_id][1], points))
+                # Entries come in time order, so dropping the older ones early keeps the same tail
+                first = tail_start(timestamps, days)
+                tails[streamer_id] = timestamps[first:].copy(), points[first:].copy()
+        for streamer_id, name, target in streamers:
+            if streamer_id in tails:
+                twitch_points_list.add_entry(Streamer.from_arrays(name, *tails[streamer_id], target))
+
+    def save_all(self, twitch_points_list):
+        """
+        Replace the contents of the database with the streamers of a list.
+        """
+        connection = self.connection()
+        with connection:
+            connection.execute("DELETE FROM entries")
+            connection.execute("DELETE FROM streamers")
+            for streamer in twitch_points_list.streamers:
+                streamer_id = connection.execute("INSERT INTO streamers (name, target) VALUES (?, ?)",
+                                                 (streamer.name, streamer.target)).lastrowid
+                connection.executemany("INSERT INTO entries (streamer, timestamp, points) VALUES (?, ?, ?)",
+                                       zip([streamer_id] * len(streamer), streamer.timestamps.tolist(),
+                                           streamer.points.tolist()))
+
+    def write(self, order, entries, records):
+        connection = self.connection()
+        ids = {}
+
+        def streamer_id(name):
+            if name not in ids:
+                row = connection.execute("SELECT id FROM streamers WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    ids[name] = connection.execute("INSERT INTO streamers (name) VALUES (?)", (name,)).lastrowid
+                else:
+                    ids[name] = row[0]
+            return ids[name]
+
+        with connection:
+            new_entries = []
+            for record in records:
+                kind, name = record[0], record[1]
+                if kind == ENTRY:
+                    new_entries.append((streamer_id(name), record[3], record[2]))
+                    continue
+                # Consecutive entries are inserted together
+                connection.executemany("INSERT INTO entries (streamer, timestamp, points) VALUES (?, ?, ?)",
+                                       new_entries)
+                new_entries = []
+                if kind == TARGET:
+                    target = record[2] if record[2] != "" else None
+                    connection.execute("UPDATE streamers SET target = ? WHERE id = ?", (target, streamer_id(name)))
+                elif kind == RENAME:
+                    connection.execute("UPDATE streamers SET name = ? WHERE id = ?", (record[2], streamer_id(name)))
+                    ids[record[2]] = ids.pop(name)
+                elif kind == DELETE:
+                    deleted = streamer_id(name)
+                    del ids[name]
+                    connection.execute("DELETE FROM entries WHERE streamer = ?", (deleted,))
+                    connection.execute("DELETE FROM streamers WHERE id = ?", (deleted,))
+            connection.executemany("INSERT INTO entries (streamer, timestamp, points) VALUES (?, ?, ?)", new_entries)
+
+    def _streamer_id(self, name):
+        row = self.connection().execute("SELECT id FROM streamers WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def entries(self, streamer, start=None, end=None):
+        query = "SELECT timestamp, points FROM entries WHERE streamer = ?"
+        parameters = [self._streamer_id(streamer.name)]
+        if start is not None:
+            query += " AND timestamp >= ?"
+            parameters.append(start)
+        if end is not None:
+            query += " AND timestamp < ?"
+            parameters.append(end)
+        rows = self.connection().execute(query + " ORDER BY timestamp", parameters).fetchall()
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        return PointsSeries.from_arrays(rows[:, 0].copy(), rows[:, 1].copy())
+
+    def daily_window(self, streamer, days):
+        """
+        Taken from the series, which hold every entry of at least the last WINDOW_DAYS days.
+        Longer windows in tail mode are read from the database.
+        """
+        if not self.tail or days <= WINDOW_DAYS:
+            return super().daily_window(streamer, days)
+        return self.daily_windows([streamer], days)[0]
+
+    def daily_windows(self, streamers, days):
+        """
+        Longer windows than the series hold are read with a single query for all streamers.
+        """
+        if not self.tail or days <= WINDOW_DAYS:
+            return super().daily_windows(streamers, days)
+        rows = self.connection().execute(DAILY_WINDOWS, (json.dumps([streamer.name for streamer in streamers]),
+                                                         US_PER_DAY, days))
+        windows = {}
+        for name, group in groupby(rows, key=lambda row: row[0]):
+            window = np.array([row[1:] for row in group], dtype=np.int64)
+            windows[name] = window[:, 0].copy(), window[:, 1].copy()
+        empty = np.zeros(0, dtype=np.int64)
+        return [windows.get(streamer.name, (empty, empty)) for streamer in streamers]
+
+
+def main():
+    from twitch_points_list import TwitchPointsList
+
+    parser = argparse.ArgumentParser(description="Convert between twitch_points.csv and an SQLite database.")
+    parser.add_argument("direction", choices=["import", "export"], help="import a csv file or export a database")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args()
+
+    twitch_points = TwitchPointsList()
+    if args.direction == "import":
+        twitch_points.load_from_file(args.source)
+        storage = SQLiteStorage(args.destination)
+        storage.save_all(twitch_points)
+    else:
+        storage = SQLiteStorage(args.source)
+        storage.load(twitch_points)
+        twitch_points.save_to_file(args.destination)
+    storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import io
+import os
+import zlib
+from os.path import isfile
+
+import numpy as np
+
+from twitch_points_files import atomic_write
+from twitch_points_journal import DELETE, RENAME, file_checksum, format_checksum, format_records, journal_filename, \
+    read_journal, snapshot_record
+from twitch_points_list import write_csv
+from twitch_points_series import PointsSeries
+
+COMPACT_SIZE = 1024 * 1024
+
+
+class Storage:
+    """
+    Where the streamers of a TwitchPointsList are kept between runs.
+    A storage loads the streamers, writes the journal records that PersistenceService derives from edits,
+    and answers range queries for the plot and the models.
+
+    The base class keeps nothing on disk and answers queries from the series in memory,
+    and from the history of streamers loaded in tail mode.
+    """
+    # Whether writes are left to the persistence thread, otherwise they are made when an edit is reported
+    write_behind = True
+
+    def load(self, twitch_points_list):
+        """
+        Add the stored streamers to a list.
+        """
+
+    def write(self, order, entries, records):
+        """
+        Persist edits.
+        :param order: streamer names in list order
+        :param entries: (name, timestamps, points, target) of every streamer, in list order
+        :param records: journal records of the edits, see twitch_points_journal
+        """
+
+    def entries(self, streamer, start=None, end=None):
+        """
+        Entries of a streamer in [start, end).
+        :param streamer: Streamer
+        :param start: first timestamp in microseconds, inclusive
+        :param end: last timestamp in microseconds, exclusive
+        :return: PointsSeries of the entries
+        """
+        series = streamer.series
+        if streamer.history is not None:
+            # Paged in from the mapped history, only the requested entries stay in memory
+            timestamps, points = streamer.history
+            series = PointsSeries.from_arrays(np.concatenate((timestamps, series.timestamps)),
+                                              np.concatenate((points, series.points)))
+        if start is None and end is None:
+            return series
+        timestamps = series.timestamps
+        inside = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            inside &= timestamps >= start
+        if end is not None:
+            inside &= timestamps < end
+        return PointsSeries.from_arrays(timestamps[inside], series.points[inside])
+
+    def daily_window(self, streamer, days):
+        """
+        Last entry of each of the last days of a streamer that have entries.
+        :param streamer: Streamer
+        :param days: number of days
+        :return: (timestamps, points) in the order of days
+        """
+        series = streamer.series
+        window = series.daily_indices[-days:]
+        return series.timestamps[window], series.points[window]
+
+    def daily_windows(self, streamers, days):
+        """
+        Daily windows of many streamers, see daily_window.
+        :param streamers: list of streamers
+        :param days: number of days
+        :return: list of (timestamps, points), in the order of streamers
+        """
+        return [self.daily_window(streamer, days) for streamer in streamers]
+
+    def close(self):
+        pass
+
+
+class CsvStorage(Storage):
+    """
+    twitch_points.csv as a snapshot with a journal of the edits made since.
+    Records are appended to the journal, once it grows past compact_size the snapshot is rewritten
+    and the journal starts over. Both files are replaced atomically.
+
+    In tail mode only the last WINDOW_DAYS days of each streamer are loaded into memory, older entries are read
+    from the column store when the full history is asked for, and when the snapshot is rewritten.
+    """
+
+    def __init__(self, filename, store=None, compact_size=COMPACT_SIZE, tail=False):
+        """
+        :param filename: csv file of the streamers
+        :param store: column store kept as a binary copy of the csv file, see TwitchPointsList.load_from_file
+        :param compact_size: journal size in bytes that triggers a compaction, 0 rewrites the csv file on every save
+        :param tail: whether to load in tail mode, which needs a store
+        """
+        if tail and store is None:
+            raise ValueError("Tail mode keeps the history in the column store, a store is needed")
+        self.filename = filename
+        self.store = store
+        self.journal = journal_filename(filename)
+        self.compact_size = compact_size
+        self.tail = tail
+        # Size of the journal in bytes, None until the first write checked which snapshot it belongs to
+        self.journal_size = None
+        # Streamer name -> history left in the store, kept up to date with the records written
+        self.history = {}
+
+    def load(self, twitch_points_list):
+        if not isfile(self.filename):
+            return
+        if not self.tail:
+            twitch_points_list.load_from_file(self.filename, self.store)
+            return
+        twitch_points_list.load_tail(self.filename, self.store)
+        self.history = {streamer.name: streamer.history for streamer in twitch_points_list.streamers
+                        if streamer.history is not None}
+
+    def write(self, order, entries, records):
+        if not records:
+            return
+        if self.history:
+            for record in records:
+                if record[0] == RENAME and record[1] in self.history:
+                    self.history[record[2]] = self.history.pop(record[1])
+                elif record[0] == DELETE:
+                    self.history.pop(record[1], None)
+        data = format_records(records).encode("utf-8")
+        if self.journal_size is None:
+            self.journal_size = self._journal_size()
+        if self.journal_size is None or self.journal_size + len(data) > self.compact_size:
+            self.compact(entries)
+        else:
+            with open(self.journal, "ab") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            self.journal_size += len(data)
+
+    def _journal_size(self):
+        """
+        Size of the journal if it belongs to the snapshot on disk. Otherwise a new journal is started,
+        the old one was either compacted into the snapshot or is ignored by the loader anyway.
+        :return: the size, None when there is no snapshot to start a journal on
+        """
+        if not isfile(self.filename):
+            return None
+        snapshot_checksum = file_checksum(self.filename)
+        if read_journal(self.journal, snapshot_checksum) is not None:
+            return os.path.getsize(self.journal)
+        return self._start_journal(snapshot_checksum)
+
+    def _start_journal(self, snapshot_checksum):
+        data = format_records([snapshot_record(snapshot_checksum)]).encode("utf-8")
+        with atomic_write(self.journal, "wb") as file:
+            file.write(data)
+        return len(data)
+
+    def compact(self, entries):
+        """
+        Rewrite the snapshot with every entry and start an empty journal on it.
+        The snapshot is written a streamer at a time, with the history of streamers loaded in tail mode
+        put back in front of their entries.
+        A crash in between leaves a journal of the old snapshot, which the loader ignores.
+        """
+        crc = size = 0
+        with atomic_write(self.filename, "wb") as file:
+            for name, timestamps, points, target in entries:
+                if name in self.history:
+                    history_timestamps, history_points = self.history[name]
+                    timestamps = np.concatenate((history_timestamps, timestamps))
+                    points = np.concatenate((history_points, points))
+                buffer = io.StringIO(newline="")
+                write_csv(buffer, [(name, timestamps, points, target)])
+                data = buffer.getvalue().encode("utf-8")
+                file.write(data)
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+        self.journal_size = self._start_journal(format_checksum(crc, size))
+
+
+def open_storage(filename="twitch_points.csv", store="twitch_points.bin", database="twitch_points.db", tail=False):
+    """
+    Open the database when it exists, the csv file otherwise.
+    :param filename: csv file of the streamers
+    :param store: column store kept next to the csv file, None to always parse the csv file
+    :param database: SQLite database, created with python twitch_points_sqlite.py import
+    :param tail: whether to keep only the recent entries of each streamer in memory
+    :return: Storage
+    """
+    if database and isfile(database):
+        from twitch_points_sqlite import SQLiteStorage
+        return SQLiteStorage(database, tail)
+    return CsvStorage(filename, store, tail=tail)
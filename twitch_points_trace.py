@@ -0,0 +1,250 @@
+"""
+Opt-in timing of the hot paths and of GUI interactions.
+
+Enable it with the TWITCH_POINTS_TRACE environment variable or main.py --trace, both naming the json file
+the results are written to on exit. TWITCH_POINTS_PROFILE or --profile N also keeps cProfile statistics
+of the N slowest interactions, written next to the json file.
+
+Hot paths are decorated with span, GUI event handlers with interaction. While tracing is off both only
+add a check of a global to the call. A handler whose result is shown later, like a plot prepared on another
+thread, keeps its interaction open with defer_interaction until it is drawn.
+"""
+import atexit
+import cProfile
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# Histogram buckets: bucket i counts durations up to BUCKET_START * 2 ** i seconds, the last one everything longer
+BUCKET_START = 1e-5
+BUCKETS = 24
+
+# Tracer while tracing is enabled
+tracer = None
+
+
+class Histogram:
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        bucket = 0 if seconds <= BUCKET_START else math.ceil(math.log2(seconds / BUCKET_START))
+        self.buckets[min(bucket, BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """
+        Upper bound of the bucket holding the given fraction of the durations.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(BUCKET_START * 2 ** bucket, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count if self.count else 0.0,
+                "min": self.min if self.count else 0.0,
+                "max": self.max,
+                "p50": self.percentile(0.5),
+                "p90": self.percentile(0.9),
+                "p99": self.percentile(0.99),
+                "buckets": {f"<={BUCKET_START * 2 ** bucket:.6g}": count
+                            for bucket, count in enumerate(self.buckets) if count}}
+
+
+class DeferredInteraction:
+    """
+    An interaction that ends when the work its handler started has been shown, rather than when the handler returns.
+    """
+    __slots__ = ("tracer", "name", "start", "window", "profile", "returned", "pending")
+
+    def __init__(self, tracer, name, start, window):
+        self.tracer = tracer
+        self.name = name
+        self.start = start
+        self.window = window
+        self.profile = None
+        # Whether the handler returned, and whether work it deferred is still to be shown
+        self.returned = False
+        self.pending = False
+
+    def finish(self):
+        """
+        End the interaction once the deferred work is drawn. Must be called on the Tk thread.
+        """
+        if not self.pending:
+            return
+        self.pending = False
+        if not self.returned:
+            # Shown before the handler returned, the handler ends the interaction
+            return
+        if self.window is not None:
+            self.window.update_idletasks()
+        self.tracer.end_interaction(self.name, time.perf_counter() - self.start, self.profile)
+
+
+class Tracer:
+    def __init__(self, filename, profile_count=0):
+        """
+        :param filename: json file the results are written to
+        :param profile_count: number of slowest interactions to keep cProfile statistics of
+        """
+        self.filename = filename
+        self.profile_count = profile_count
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.interactions = {}
+        # (seconds, name, profile) of the slowest interactions
+        self.slowest = []
+        self.active = threading.local()
+
+    def record(self, histograms, name, seconds):
+        with self.lock:
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def span(self, name, function, args, kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.record(self.spans, name, time.perf_counter() - start)
+
+    def interaction(self, name, function, args, kwargs):
+        if getattr(self.active, "interaction", None) is not None:
+            # Nested handler, the outer interaction covers it
+            return function(*args, **kwargs)
+        profile = cProfile.Profile() if self.profile_count else None
+        window = getattr(args[0], "window", None) if args else None
+        start = time.perf_counter()
+        self.active.interaction = DeferredInteraction(self, name, start, window)
+        try:
+            if profile:
+                profile.enable()
+            result = function(*args, **kwargs)
+            # Count the repaint: redraws are idle tasks that would run after the handler returns
+            if window is not None:
+                window.update_idletasks()
+            return result
+        finally:
+            if profile:
+                profile.disable()
+            seconds = time.perf_counter() - start
+            deferred = self.active.interaction
+            self.active.interaction = None
+            deferred.returned = True
+            if not deferred.pending:
+                self.end_interaction(name, seconds, profile)
+            else:
+                # Ended by defer_interaction's callback, the profile only covers the handler
+                deferred.profile = profile
+
+    def defer(self):
+        deferred = getattr(self.active, "interaction", None)
+        if deferred is None:
+            return None
+        deferred.pending = True
+        return deferred.finish
+
+    def end_interaction(self, name, seconds, profile):
+        self.record(self.interactions, name, seconds)
+        if profile:
+            self.keep_profile(seconds, name, profile)
+
+    def keep_profile(self, seconds, name, profile):
+        with self.lock:
+            self.slowest.append((seconds, name, profile))
+            self.slowest.sort(key=lambda slow: slow[0], reverse=True)
+            del self.slowest[self.profile_count:]
+
+    def dump(self):
+        with self.lock:
+            slowest = []
+            base, _ = os.path.splitext(self.filename)
+            for rank, (seconds, name, profile) in enumerate(self.slowest, start=1):
+                profile_file = f"{base}.{rank}.{name}.prof"
+                profile.dump_stats(profile_file)
+                slowest.append({"name": name, "seconds": seconds, "profile": profile_file})
+            results = {"spans": {name: histogram.to_dict() for name, histogram in sorted(self.spans.items())},
+                       "interactions": {name: histogram.to_dict()
+                                        for name, histogram in sorted(self.interactions.items())},
+                       "slowest_interactions": slowest}
+        with open(self.filename, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+def enable(filename, profile_count=0):
+    """
+    Start tracing, the results are written to filename when the program exits.
+    """
+    global tracer
+    if tracer is not None:
+        return
+    tracer = Tracer(filename, profile_count)
+    atexit.register(tracer.dump)
+
+
+def enable_from_environment():
+    filename = os.environ.get("TWITCH_POINTS_TRACE")
+    if filename:
+        enable(filename, int(os.environ.get("TWITCH_POINTS_PROFILE", "0")))
+
+
+def span(name):
+    """
+    Decorator timing every call of a function under name.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return function(*args, **kwargs)
+            return tracer.span(name, function, args, kwargs)
+        return wrapper
+    return decorate
+
+
+def defer_interaction():
+    """
+    Keep the interaction of the running handler open until the returned function is called,
+    e.g. by the callback that draws a plot prepared on another thread. An interaction whose deferred work
+    is dropped, like a plot request replaced by a newer one, is not counted.
+    :return: function ending the interaction, None while tracing is off or outside of an interaction
+    """
+    if tracer is None:
+        return None
+    return tracer.defer()
+
+
+def interaction(name):
+    """
+    Decorator of GUI event handlers, timing from the event until the window has repainted.
+    The handler's object is expected to have its Tk window in a window attribute.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return function(*args, **kwargs)
+            return tracer.interaction(name, function, args, kwargs)
+        return wrapper
+    return decorate